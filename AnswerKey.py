@@ -0,0 +1,162 @@
+import io
+import os
+import re
+import json
+import xml.etree.ElementTree as ET
+from HITCache import question_hash
+
+# Selection identifiers written by build_hit_xml start with correct_ or incorrect_
+CORRECT_PREFIX = "correct_"
+
+# One Answer of the Answer XML, with its selections if it has any
+ANSWER_PATTERN = re.compile(
+    r"<QuestionIdentifier>\s*([^<]*?)\s*</QuestionIdentifier>\s*"
+    r"((?:<SelectionIdentifier>[^<]*</SelectionIdentifier>\s*)*)"
+)
+SELECTION_PATTERN = re.compile(r"<SelectionIdentifier>\s*([^<]*?)\s*</SelectionIdentifier>")
+
+
+def _local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+def answer_key_from_xml(question_xml):
+    # The identifiers of all questions of a HIT form and the correct
+    # selections of every selection question
+    questions = []
+    correct = {}
+    for _, element in ET.iterparse(
+        io.BytesIO(question_xml.encode("utf-8")), events=("end",)
+    ):
+        if _local_name(element.tag) != "Question":
+            continue
+        identifier = None
+        selections = []
+        for child in element.iter():
+            name = _local_name(child.tag)
+            if name == "QuestionIdentifier":
+                identifier = (child.text or "").strip()
+            elif name == "SelectionIdentifier":
+                selections.append((child.text or "").strip())
+        element.clear()
+        questions.append(identifier)
+        if selections:
+            correct[identifier] = [
+                selection
+                for selection in selections
+                if selection.startswith(CORRECT_PREFIX)
+            ]
+    return {"Questions": questions, "Correct": correct}
+
+
+def write_answer_key(answer_keys_file, question_xml):
+    # Appends the key of one HIT form to an open JSONL file and returns its hash
+    key = question_hash(question_xml)
+    entry = {"QuestionHash": key, **answer_key_from_xml(question_xml)}
+    answer_keys_file.write(json.dumps(entry) + "\n")
+    return key
+
+
+def load_answer_keys(path):
+    # QuestionHash -> key with sets for fast lookups, a cut-off last line is ignored
+    answer_keys = {}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                answer_keys[entry["QuestionHash"]] = _compile(entry)
+    except FileNotFoundError:
+        pass
+    return answer_keys
+
+
+def _compile(entry):
+    return {
+        "Questions": frozenset(entry["Questions"]),
+        "Correct": {
+            identifier: frozenset(selections)
+            for identifier, selections in entry["Correct"].items()
+        },
+    }
+
+
+def grade_answer_xml(answer_xml, answer_key):
+    # Returns the number of correct and incorrect selection questions and the
+    # questions of the form without an answer, straight from the raw XML
+    correct = incorrect = 0
+    answered = set()
+    keys = answer_key["Correct"]
+    for identifier, selections in ANSWER_PATTERN.findall(answer_xml or ""):
+        answered.add(identifier)
+        expected = keys.get(identifier)
+        if expected is None:
+            continue
+        if expected.intersection(SELECTION_PATTERN.findall(selections)):
+            correct += 1
+        else:
+            incorrect += 1
+    missing = sorted(answer_key["Questions"] - answered)
+    return {"Correct": correct, "Incorrect": incorrect, "Missing": missing}
+
+
+class AnswerGrader:
+    # Grades assignments by the QuestionHash of their HIT form. Forms without
+    # a precomputed key get one from their question XML, once per form.
+    def __init__(self, answer_keys=None, hit_cache=None):
+        if isinstance(answer_keys, (str, os.PathLike)):
+            answer_keys = load_answer_keys(answer_keys)
+        self.answer_keys = dict(answer_keys or {})
+        self.hit_cache = hit_cache
+
+    def answer_key(self, key, question_xml=None):
+        answer_key = self.answer_keys.get(key)
+        if answer_key is None:
+            if question_xml is None and self.hit_cache is not None:
+                question_xml = self.hit_cache.question(key)
+            if question_xml is None:
+                return None
+            answer_key = self.answer_keys[key] = _compile(
+                answer_key_from_xml(question_xml)
+            )
+        return answer_key
+
+    def grade(self, assignment):
+        # assignment holds Answer and QuestionHash or Question, as in the HIT cache
+        key = assignment.get("QuestionHash")
+        if key is None and assignment.get("Question") is not None:
+            key = question_hash(assignment["Question"])
+        answer_key = self.answer_key(key, assignment.get("Question"))
+        if answer_key is None:
+            return None
+        return grade_answer_xml(assignment["Answer"], answer_key)
+
+    def grade_many(self, assignments):
+        # AssignmentId -> grade, None when the form of the assignment is unknown
+        return {
+            assignment["AssignmentId"]: self.grade(assignment)
+            for assignment in assignments
+        }
+
+    def grade_cached(self, hit_ids=None):
+        # Grades the assignments of the HIT cache from their stored Answer XML
+        return self.grade_many(self.hit_cache.get_assignments(hit_ids))
+
+
+def passes(grade, min_correct_answers=2):
+    # The control question rule of AssignmentFilter
+    return grade is not None and grade["Correct"] >= min_correct_answers
+
+
+# Usage
+
+"""
+process_directory_in_chunks(input_directory, output_directory,
+                            answer_keys_path='mturk_cache/answer_keys.jsonl')
+cache = open_hit_cache(full_cache_path)
+grader = AnswerGrader('mturk_cache/answer_keys.jsonl', hit_cache=cache)
+grades = grader.grade_cached(hit_ids)
+failed = [assignment_id for assignment_id, grade in grades.items() if not passes(grade)]
+"""
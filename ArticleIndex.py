@@ -0,0 +1,47 @@
+import re
+from functools import cached_property, lru_cache
+from text_helpers import normalize_whitespace
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Number of words in the shingles used for the overlap ratio
+SHINGLE_LENGTH = 3
+
+
+def word_shingles(text, length=SHINGLE_LENGTH):
+    words = WORD_PATTERN.findall(text.casefold())
+    if len(words) < length:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + length]) for i in range(len(words) - length + 1)}
+
+
+class ArticleIndex:
+    def __init__(self, article):
+        # The article is normalized once, fragments are then found with a
+        # plain substring search on the normalized text
+        self.text = normalize_whitespace(article)
+
+    @cached_property
+    def shingles(self):
+        # Hashes of the word trigrams, they take far less memory than the tuples.
+        # Built on first use, since the fragment checks do not need them.
+        return frozenset(map(hash, word_shingles(self.text)))
+
+    def contains(self, fragment):
+        return normalize_whitespace(fragment) in self.text
+
+    def fragment_ratio(self, source, separator="."):
+        fragments = source.split(separator)
+        return sum(1 for fragment in fragments if self.contains(fragment)) / len(fragments)
+
+    def overlap_ratio(self, text):
+        shingles = set(map(hash, word_shingles(text)))
+        if not shingles:
+            return 0.0
+        return len(shingles & self.shingles) / len(shingles)
+
+
+@lru_cache(maxsize=1024)
+def get_article_index(article):
+    # Assignments share articles, so each article is indexed once per process
+    return ArticleIndex(article)
@@ -0,0 +1,178 @@
+import os
+import re
+import hashlib
+import sqlite3
+import threading
+from text_helpers import remove_emojis, normalize_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    ArticleId TEXT PRIMARY KEY,
+    Text TEXT NOT NULL
+);
+"""
+
+# The article body of every Overview in the HIT XML written by build_hit_xml
+OVERVIEW_TEXT_PATTERN = re.compile(
+    r"(<Overview><Title>[^<]*</Title><Text><!\[CDATA\[)(.*?)(\]\]></Text></Overview>)",
+    re.DOTALL,
+)
+# A body replaced by a reference to the store
+REFERENCE_PREFIX = "@article:"
+REFERENCE_PATTERN = re.compile(
+    r"<!\[CDATA\[" + re.escape(REFERENCE_PREFIX) + r"([0-9a-f]{40})\]\]>"
+)
+
+
+def normalize_article(text):
+    return normalize_text(remove_emojis(text))
+
+
+def article_id(text):
+    # The same article gets the same id whatever its emojis or whitespace
+    return hashlib.sha1(normalize_article(text).encode("utf-8")).hexdigest()
+
+
+def overview_texts(question_xml):
+    return [match.group(2) for match in OVERVIEW_TEXT_PATTERN.finditer(question_xml)]
+
+
+class ArticleStore:
+    # Every distinct article once, keyed by the hash of its normalized text.
+    # The first text stored under an id is kept, so callers only replace a
+    # text by its id when the stored text is exactly the same.
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = None
+        self.lock = threading.Lock()
+        self._texts = {}
+
+    def __getstate__(self):
+        # Worker processes open their own connection
+        state = self.__dict__.copy()
+        state["connection"] = None
+        state["lock"] = None
+        state["_texts"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(
+                self.db_path, check_same_thread=False, isolation_level=None
+            )
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return self._connect().execute(sql, parameters).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM articles")[0][0]
+
+    def __contains__(self, article_id):
+        return self.get(article_id) is not None
+
+    def put_many(self, texts):
+        # Returns the id of every text, new articles are inserted in one transaction
+        ids = [article_id(text) for text in texts]
+        new = {i: text for i, text in zip(ids, texts) if i not in self._texts}
+        if new:
+            with self.lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute("BEGIN")
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO articles (ArticleId, Text) VALUES (?, ?)",
+                        new.items(),
+                    )
+        return ids
+
+    def put(self, text):
+        return self.put_many([text])[0]
+
+    def get_many(self, article_ids):
+        missing = list({i for i in article_ids if i not in self._texts})
+        # Stay below SQLite's limit on the number of parameters
+        for i in range(0, len(missing), 500):
+            chunk = missing[i : i + 500]
+            rows = self._query(
+                "SELECT ArticleId, Text FROM articles WHERE ArticleId IN (%s)"
+                % ",".join("?" * len(chunk)),
+                chunk,
+            )
+            self._texts.update(rows)
+        return {i: self._texts[i] for i in article_ids if i in self._texts}
+
+    def get(self, article_id):
+        return self.get_many([article_id]).get(article_id)
+
+    def reference(self, text):
+        # The id to store instead of text, or None when the store holds a
+        # different variant of the article and the text must be kept
+        text_id = self.put(text)
+        return text_id if self.get(text_id) == text else None
+
+    def compact_question_xml(self, question_xml):
+        # Replaces every article body of a HIT form by a reference
+        texts = overview_texts(question_xml)
+        if not texts:
+            return question_xml
+        stored = self.get_many(self.put_many(texts))
+
+        def replace(match):
+            text_id = article_id(match.group(2))
+            if stored.get(text_id) != match.group(2):
+                return match.group(0)
+            return match.group(1) + REFERENCE_PREFIX + text_id + match.group(3)
+
+        return OVERVIEW_TEXT_PATTERN.sub(replace, question_xml)
+
+    def expand_question_xml(self, question_xml):
+        ids = REFERENCE_PATTERN.findall(question_xml)
+        if not ids:
+            return question_xml
+        texts = self.get_many(ids)
+        return REFERENCE_PATTERN.sub(
+            lambda match: "<![CDATA[" + texts[match.group(1)] + "]]>", question_xml
+        )
+
+    def resolve_assignment(self, data):
+        # Fills in the QuestionText of parsed assignments stored with an ArticleId
+        qa_list = data.get("QuestionsAndAnswers", [])
+        ids = [
+            qa["ArticleId"]
+            for qa in qa_list
+            if qa.get("QuestionText") is None and qa.get("ArticleId")
+        ]
+        if ids:
+            texts = self.get_many(ids)
+            for qa in qa_list:
+                if qa.get("QuestionText") is None and qa.get("ArticleId") in texts:
+                    qa["QuestionText"] = texts[qa["ArticleId"]]
+        return data
+
+
+# Usage
+
+"""
+store = ArticleStore('mturk_cache/articles.sqlite')
+text_id = store.put(article_text)
+assert store.get(text_id) == article_text
+compact_xml = store.compact_question_xml(question_xml)
+assert store.expand_question_xml(compact_xml) == question_xml
+"""
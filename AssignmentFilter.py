@@ -1,167 +1,334 @@
 ﻿import os
 import json
-from langdetect import detect
-from langdetect import DetectorFactory
-DetectorFactory.seed = 0
+import hashlib
+import concurrent.futures
+from VerdictCache import VerdictCache
+from LanguageDetector import LanguageDetector
+from ArticleIndex import get_article_index
+from AssignmentSource import open_source, duration_to_minutes
+from NearDuplicateIndex import submit_order
 
+# Bump whenever the logic of a rule changes so cached verdicts are recomputed
+RULESET_REVISION = 2
 
-class AssignmentFilter:
-    def __init__(self, folder_path):
-        self.folder_path = folder_path
 
-    def convert_to_minutes(self, duration_str):
-        parts = duration_str.split(' ')  # Split '0 days' from '00:13:14'
-        time_part = parts[-1]  # Get the '00:13:14' part
-        # Split into hours, minutes, and seconds
-        h, m, s = map(int, time_part.split(':'))
-        return h * 60 + m + s / 60  # Convert to total minutes
+# Filter instance shared by the worker processes of evaluate_assignments
+_worker_filter = None
 
-    def check_answers(self, questions_and_answers):
-        correct_count = 3
 
-        for qa in questions_and_answers[3:]:
-            answer = qa["Answers"][0]["Answer"].split("_")[0]
-            # Check if there are answers and the first one is correct
-            if answer == "incorrect":
-                correct_count -= 1
-        # Return True if there are less than two correct answers
-        return correct_count < 2
+def _init_worker(assignment_filter):
+    global _worker_filter
+    _worker_filter = assignment_filter
 
-    def check_source_in_summary(self, questions_and_answers):
-        source_is_insuficient = False
-        for qa in questions_and_answers[3:]:
 
-            summary = qa["Answers"][1]['Answer']
-            source = qa["Answers"][2]['Answer']
+def _evaluate_item(item):
+    verdict = _worker_filter.evaluate_item(item)
+    # Hand the detected languages back so the parent can memoize them
+    return verdict, _worker_filter.language_detector.pop_new_entries()
 
-            if source in summary:
-                source_is_insuficient = True
-
-        return source_is_insuficient
 
-    def check_source_in_text(self, questions_and_answers):
+def is_suitable_for_detection(text, min_length):
+    # Ensure the text is not empty, meets minimum length, and contains alphabetic characters
+    return len(text) >= min_length and any(char.isalpha() for char in text)
 
-        source_in_text = True
 
-        for qa in questions_and_answers[3:]:
-
-            article = qa["QuestionText"]
-            source = qa["Answers"][2]['Answer']
-
-            source_elements = source.split(".")
-
-            num_elements_in_article = 0
+class AssignmentFilter:
+    def __init__(self, folder_path, max_workers=None, min_duration=5,
+                 min_correct_answers=2, min_summary_length=20,
+                 min_source_length=15, min_source_in_text=0.95, cache_path=None,
+                 language_detector=None, article_store=None, duplicate_index=None,
+                 min_detect_summary_length=20, min_detect_source_length=15):
+        # folder_path is a folder of JSON files or a Parquet/Arrow file of assignments,
+        # article_store is needed when they were parsed with one
+        self.folder_path = folder_path
+        self.source = open_source(folder_path, article_store)
+        self.max_workers = max_workers
+        self.cache_path = cache_path
+        self.min_duration = min_duration
+        self.min_correct_answers = min_correct_answers
+        self.min_summary_length = min_summary_length
+        self.min_source_length = min_source_length
+        self.min_source_in_text = min_source_in_text
+        # Shorter texts are not passed to language detection, apart from the length rules
+        self.min_detect_summary_length = min_detect_summary_length
+        self.min_detect_source_length = min_detect_source_length
+        self.language_detector = language_detector or LanguageDetector()
+        # A NearDuplicateIndex of summaries, summaries close to one submitted
+        # earlier by another assignment fail the near_duplicate_summary rule
+        self.duplicate_index = duplicate_index
+        self._indexed = None
+
+    def __getstate__(self):
+        # Worker processes only run _evaluate_rules, the near-duplicate check
+        # runs in the parent and the language memo stays there
+        state = self.__dict__.copy()
+        state["duplicate_index"] = None
+        state["_indexed"] = None
+        state["language_detector"] = self.language_detector.worker_copy()
+        return state
+
+    def ruleset_version(self):
+        ruleset = {
+            "revision": RULESET_REVISION,
+            "min_duration": self.min_duration,
+            "min_correct_answers": self.min_correct_answers,
+            "min_summary_length": self.min_summary_length,
+            "min_source_length": self.min_source_length,
+            "min_source_in_text": self.min_source_in_text,
+            "min_detect_summary_length": self.min_detect_summary_length,
+            "min_detect_source_length": self.min_detect_source_length,
+            "language_detector": self.language_detector.version(),
+        }
+        # The near_duplicate_summary rule is not part of the cached verdicts
+        return hashlib.sha1(json.dumps(ruleset, sort_keys=True).encode()).hexdigest()
 
-            for element in source_elements:
-                if element in article:
-                    num_elements_in_article += 1
+    def convert_to_minutes(self, duration_str):
+        return duration_to_minutes(duration_str)
 
-            avg_elements_in_article = num_elements_in_article / \
-                len(source_elements)
+    def _summary_and_source(self, qa):
+        return qa["Answers"][1]['Answer'], qa["Answers"][2]['Answer']
 
-            if avg_elements_in_article < 0.95:
-                source_in_text = False
+    def _is_answer_incorrect(self, qa):
+        return qa["Answers"][0]["Answer"].split("_")[0] == "incorrect"
 
-        return source_in_text
+    def _source_in_text_ratio(self, source, article):
+        return get_article_index(article).fragment_ratio(source)
 
-    def check_summary_in_text(self, questions_and_answers):
+    def _detect_language(self, text):
+        # None means the text could not be detected, most likely because a link was passed
+        return self.language_detector.detect(text)
 
-        summary_in_text = False
+    def check_answers(self, questions_and_answers):
+        correct_count = 3
 
         for qa in questions_and_answers[3:]:
+            # Check if there are answers and the first one is correct
+            if self._is_answer_incorrect(qa):
+                correct_count -= 1
+        # Return True if there are less than two correct answers
+        return correct_count < self.min_correct_answers
 
-            questionText = qa["QuestionText"]
-            summary = qa["Answers"][1]['Answer']
-
-            if summary in questionText:
-                summary_in_text = True
-
-        return summary_in_text
+    def check_source_in_summary(self, questions_and_answers):
+        return any(source in summary for summary, source in
+                   map(self._summary_and_source, questions_and_answers[3:]))
 
-    def checkLenghtOfSummary(self, questions_and_answers):
-        summary_is_too_short = False
+    def check_source_in_text(self, questions_and_answers):
         for qa in questions_and_answers[3:]:
+            source = qa["Answers"][2]['Answer']
+            if self._source_in_text_ratio(source, qa["QuestionText"]) < self.min_source_in_text:
+                return False
+        return True
 
-            summary = qa["Answers"][1]['Answer']
-            if len(summary) < 20:
-                summary_is_too_short = True
+    def check_summary_in_text(self, questions_and_answers):
+        return any(get_article_index(qa["QuestionText"]).contains(qa["Answers"][1]['Answer'])
+                   for qa in questions_and_answers[3:])
 
-        return summary_is_too_short
+    def checkLenghtOfSummary(self, questions_and_answers):
+        return any(len(qa["Answers"][1]['Answer']) < self.min_summary_length
+                   for qa in questions_and_answers[3:])
 
     def checkLengthOfSource(self, questions_and_answers):
-        source_is_too_short = False
-        for qa in questions_and_answers[3:]:
-
-            source = qa["Answers"][2]['Answer']
-            if len(source) < 15:
-                source_is_too_short = True
-
-        return source_is_too_short
+        return any(len(qa["Answers"][2]['Answer']) < self.min_source_length
+                   for qa in questions_and_answers[3:])
 
     def checkLanguage(self, questions_and_answers, assignmentID):
-        summary_or_source_is_not_norwegian = False
-
         for qa in questions_and_answers[3:]:
-            summary = qa["Answers"][1]['Answer']
-            source = qa["Answers"][2]['Answer']
-
-            # Function to check if text is suitable for language detection
-            def is_suitable_for_detection(text, min_length):
-                # Ensure the text is not empty, meets minimum length, and contains alphabetic characters
-                return len(text) >= min_length and any(char.isalpha() for char in text)
-
-            try:
-                # Check for summary with minimum 20 characters
-                if is_suitable_for_detection(summary, 20):
-                    summary_language = detect(summary)
-                    if summary_language != 'no':
-                        summary_or_source_is_not_norwegian = True
-
-                # Check for source with minimum 15 characters
-                if is_suitable_for_detection(source, 15):
-                    source_language = detect(source)
-                    if source_language != 'no':
-                        summary_or_source_is_not_norwegian = True
-            except Exception as e:
-                # If exception occurs, the reason is most likely beacuse they have passed a link as source
-                summary_or_source_is_not_norwegian = True
-
-        return summary_or_source_is_not_norwegian
+            summary, source = self._summary_and_source(qa)
+            if is_suitable_for_detection(summary, self.min_detect_summary_length) and self._detect_language(summary) != 'no':
+                return True
+            if is_suitable_for_detection(source, self.min_detect_source_length) and self._detect_language(source) != 'no':
+                return True
+        return False
+
+    def evaluate(self, data):
+        verdict = self._evaluate_rules(data)
+        if self.duplicate_index is not None:
+            verdict = self._with_duplicates(verdict, self.duplicate_failures(data))
+        return verdict
+
+    def _evaluate_rules(self, data):
+        # Evaluate every rule but near_duplicate_summary in a single pass over
+        # the texts of the assignment, these verdicts are what the cache holds
+        failed = {}
+        overlap = {}
+        duration_minutes = self.convert_to_minutes(data['Duration'])
+        if duration_minutes < self.min_duration:
+            failed["duration"] = duration_minutes
 
-    def filter_assignments(self):
-        assignment_ids = []
-
-        for file_name in os.listdir(self.folder_path):
-            if file_name.endswith('.json'):
-                with open(os.path.join(self.folder_path, file_name), 'r') as file:
-                    data = json.load(file)
-
-                    duration_minutes = self.convert_to_minutes(
-                        data['Duration'])
-
-                    are_answers_insufficient = self.check_answers(
-                        data['QuestionsAndAnswers'])
-
-                    are_source_in_summary = self.check_source_in_summary(
-                        data['QuestionsAndAnswers'])
-
-                    are_source_in_text = self.check_source_in_text(
-                        data['QuestionsAndAnswers'])
-
-                    are_summary_too_short = self.checkLenghtOfSummary(
-                        data['QuestionsAndAnswers'])
-
-                    are_source_too_short = self.checkLengthOfSource(
-                        data['QuestionsAndAnswers'])
-
-                    are_language_not_norwegian = self.checkLanguage(
-                        data['QuestionsAndAnswers'], data['AssignmentId'])
+        correct_count = 3
+        detections = []
+        for qa in data['QuestionsAndAnswers'][3:]:
+            title = qa.get("Title")
+            article = get_article_index(qa["QuestionText"])
+            summary, source = self._summary_and_source(qa)
+            overlap[title] = {"Summary": article.overlap_ratio(summary),
+                              "Source": article.overlap_ratio(source)}
+
+            if self._is_answer_incorrect(qa):
+                correct_count -= 1
 
-                    are_summary_in_text = self.check_summary_in_text(
-                        data['QuestionsAndAnswers'])
+            if source in summary:
+                failed.setdefault("source_in_summary", []).append(title)
+
+            ratio = article.fragment_ratio(source)
+            if ratio < self.min_source_in_text:
+                failed.setdefault("source_not_in_text", []).append(
+                    {"Title": title, "Ratio": ratio})
+
+            if article.contains(summary):
+                failed.setdefault("summary_in_text", []).append(title)
+
+            if len(summary) < self.min_summary_length:
+                failed.setdefault("summary_too_short", []).append(
+                    {"Title": title, "Length": len(summary)})
+
+            if len(source) < self.min_source_length:
+                failed.setdefault("source_too_short", []).append(
+                    {"Title": title, "Length": len(source)})
+
+            for field, text, min_length in (("Summary", summary, self.min_detect_summary_length),
+                                            ("Source", source, self.min_detect_source_length)):
+                if is_suitable_for_detection(text, min_length):
+                    detections.append((title, field, text))
+
+        # Detect the languages of all texts of the assignment in one batch
+        languages = self.language_detector.detect_many([text for _, _, text in detections])
+        for (title, field, _), language in zip(detections, languages):
+            if language != 'no':
+                failed.setdefault("language", []).append(
+                    {"Title": title, "Field": field, "Language": language})
+
+        if correct_count < self.min_correct_answers:
+            failed["answers"] = correct_count
+
+        return {
+            "AssignmentId": data['AssignmentId'],
+            "WorkerId": data.get('WorkerId'),
+            "Rejected": bool(failed),
+            "Failed": failed,
+            "Overlap": overlap,
+        }
+
+    def _indexed_keys(self):
+        # AssignmentId -> keys of its summaries in the index, rebuilt when it grows
+        if self._indexed is None or self._indexed[0] != len(self.duplicate_index):
+            indexed = {}
+            for key in self.duplicate_index.keys:
+                indexed.setdefault(key.partition("#")[0], []).append(key)
+            self._indexed = (len(self.duplicate_index), indexed)
+        return self._indexed[1]
+
+    def _duplicate_failure(self, title, matches):
+        return {"Title": title, "Matches": [key for key, _ in matches[:5]],
+                "Similarity": matches[0][1]}
+
+    def _indexed_duplicate_failures(self, keys):
+        failures = []
+        for key in keys:
+            own_prefix = key.partition("#")[0] + "#"
+            matches = self.duplicate_index.earlier_matches(
+                key, exclude=lambda match: match.startswith(own_prefix))
+            if matches:
+                failures.append(self._duplicate_failure(key.partition("#")[2], matches))
+        return failures
+
+    def duplicate_failures(self, data):
+        # Summaries of the assignment close to a summary another assignment
+        # submitted before it, so only the copy fails and not the original.
+        # Indexed summaries are checked through their stored signatures.
+        keys = self._indexed_keys().get(data['AssignmentId'])
+        if keys:
+            return self._indexed_duplicate_failures(keys)
+        own_prefix = f"{data['AssignmentId']}#"
+        before = submit_order(data.get('SubmitTime'))
+        failures = []
+        for qa in data['QuestionsAndAnswers'][3:]:
+            matches = self.duplicate_index.query(
+                qa["Answers"][1]['Answer'], before=before,
+                exclude=lambda key: key.startswith(own_prefix))
+            if matches:
+                failures.append(self._duplicate_failure(qa.get("Title"), matches))
+        return failures
+
+    def _with_duplicates(self, verdict, failures):
+        if not failures:
+            return verdict
+        return {**verdict, "Rejected": True,
+                "Failed": {**verdict["Failed"], "near_duplicate_summary": failures}}
+
+    def _apply_duplicate_rule(self, verdicts, items):
+        # Runs after the cached rules, so adding summaries to the index does not
+        # invalidate cached verdicts. Only assignments missing from the index
+        # are loaded again.
+        if self.duplicate_index is None:
+            return verdicts
+        indexed = self._indexed_keys()
+        checked = []
+        for verdict, item in zip(verdicts, items):
+            keys = indexed.get(verdict["AssignmentId"])
+            if keys:
+                failures = self._indexed_duplicate_failures(keys)
+            else:
+                failures = self.duplicate_failures(self.source.load(item))
+            checked.append(self._with_duplicates(verdict, failures))
+        return checked
+
+    def evaluate_file(self, file_path):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        verdict = self.evaluate(data)
+        verdict["File"] = file_path
+        return verdict
+
+    def evaluate_item(self, item):
+        verdict = self._evaluate_rules(self.source.load(item))
+        verdict["File"] = self.source.file_path(item)
+        return verdict
+
+    def _evaluate_items(self, items):
+        if self.max_workers == 1 or len(items) < 2:
+            return [self.evaluate_item(item) for item in items]
+
+        max_workers = self.max_workers or os.cpu_count() or 1
+        chunksize = max(1, len(items) // (max_workers * 4))
+        verdicts = []
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, initializer=_init_worker,
+                initargs=(self,)) as executor:
+            for verdict, languages in executor.map(_evaluate_item, items, chunksize=chunksize):
+                self.language_detector.update(languages)
+                verdicts.append(verdict)
+        return verdicts
+
+    def evaluate_assignments(self):
+        verdicts = self._evaluate_assignments()
+        self.language_detector.save()
+        return verdicts
+
+    def _evaluate_assignments(self):
+        entries = self.source.entries()
+
+        items = [item for item, _, _ in entries]
+        if self.cache_path is None:
+            return self._apply_duplicate_rule(self._evaluate_items(items), items)
+
+        # Only new or changed assignments are evaluated, the rest come from the cache
+        cache = VerdictCache(self.cache_path, self.ruleset_version())
+        verdicts = [cache.get(entry, key) for _, entry, key in entries]
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        new_verdicts = self._evaluate_items([entries[i][0] for i in pending])
+        for i, verdict in zip(pending, new_verdicts):
+            cache.put(entries[i][1], entries[i][2], verdict)
+            verdicts[i] = verdict
+
+        cache.prune([entry for _, entry, _ in entries])
+        cache.save()
+        return self._apply_duplicate_rule(verdicts, items)
 
-                    if duration_minutes < 5 or are_answers_insufficient or are_source_in_summary or are_summary_too_short or are_summary_in_text or are_source_too_short or are_language_not_norwegian or not are_source_in_text:
-                        assignment_ids.append(data['AssignmentId'])
+    def filter_assignments(self):
+        assignment_ids = [verdict["AssignmentId"]
+                          for verdict in self.evaluate_assignments()
+                          if verdict["Rejected"]]
 
         print("DONE")
         return assignment_ids
@@ -171,10 +338,19 @@ class AssignmentFilter:
 
 """
 folder_path = 'ParsedNotFilteredHITS'
-assignment_filter = AssignmentFilter(folder_path)
+# cache_path is optional, repeat runs then only evaluate new or changed files
+# Detected languages are memoized across runs by passing a LanguageDetector with a memo_path
+# Summaries copied across assignments are caught by passing a NearDuplicateIndex as duplicate_index
+assignment_filter = AssignmentFilter(folder_path, cache_path='mturk_cache/assignment_verdicts.json',
+                                     language_detector=LanguageDetector('mturk_cache/languages.json'))
 filtered_assignment_ids = assignment_filter.filter_assignments()
 print(len(filtered_assignment_ids))
 
 for assignment_id in filtered_assignment_ids:
     print(assignment_id)
+
+# Per-assignment verdicts with the failed rules and their values
+for verdict in assignment_filter.evaluate_assignments():
+    if verdict["Rejected"]:
+        print(verdict["AssignmentId"], verdict["Failed"])
 """
@@ -0,0 +1,158 @@
+﻿import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from VerdictCache import VerdictCache
+
+# Columns of the per-text lists written by mturk_helpers.parse_assignments
+TEXT_COLUMN = 'QuestionText'
+LIST_COLUMNS = ('Titles', TEXT_COLUMN, 'Answers')
+# ArticleId of every text, written when the texts are kept in an ArticleStore
+ARTICLE_ID_COLUMN = 'ArticleIds'
+# Everything that can change the verdict of an assignment except its article texts
+KEY_COLUMNS = ('AssignmentId', 'AssignmentStatus', 'Duration', 'Titles', 'Answers')
+
+
+def duration_to_minutes(duration_str):
+    parts = duration_str.split(' ')  # Split '0 days' from '00:13:14'
+    time_part = parts[-1]  # Get the '00:13:14' part
+    # Split into hours, minutes, and seconds
+    h, m, s = map(int, time_part.split(':'))
+    return h * 60 + m + s / 60  # Convert to total minutes
+
+
+def durations_to_minutes(durations):
+    # Durations repeat a lot, so the distinct strings are parsed in one vectorized
+    # call, values pandas can't read fall back to duration_to_minutes
+    durations = pd.Series(durations, dtype=object)
+    codes, uniques = pd.factorize(durations)
+    uniques = pd.Series(uniques, dtype=object)
+    minutes = (pd.to_timedelta(uniques, errors='coerce').dt.total_seconds() / 60).to_numpy()
+    unparsed = np.isnan(minutes)
+    if unparsed.any():
+        minutes[unparsed] = [duration_to_minutes(duration) for duration in uniques[unparsed]]
+    # Missing durations have code -1 and stay NaN
+    return pd.Series(np.append(minutes, np.nan)[codes], index=durations.index)
+
+
+def assignment_from_row(row):
+    # Rebuilds the layout of an assignment JSON file from a columnar row
+    data = {column: value for column, value in row.items()
+            if column not in LIST_COLUMNS and column != ARTICLE_ID_COLUMN}
+    titles, texts, answers = (json.loads(row[column]) for column in LIST_COLUMNS)
+    data['QuestionsAndAnswers'] = [
+        {'Title': title, 'QuestionText': text, 'Answers': text_answers}
+        for title, text, text_answers in zip(titles, texts, answers)]
+    if row.get(ARTICLE_ID_COLUMN):
+        for qa, text_id in zip(data['QuestionsAndAnswers'], json.loads(row[ARTICLE_ID_COLUMN])):
+            if text_id is not None:
+                qa['ArticleId'] = text_id
+    return data
+
+
+class JsonFolderSource:
+    # One JSON file per assignment, as written to ParsedNotFilteredHITS.
+    # Texts written as an ArticleId are read back from article_store.
+    def __init__(self, folder_path, article_store=None):
+        self.path = folder_path
+        self.article_store = article_store
+
+    def entries(self):
+        # (item to load, cache entry, cache key) per assignment
+        entries = []
+        with os.scandir(self.path) as dir_entries:
+            for entry in dir_entries:
+                if entry.name.endswith('.json'):
+                    file_path = os.path.join(self.path, entry.name)
+                    entries.append((file_path, file_path, VerdictCache.file_key(entry.stat())))
+        return entries
+
+    def file_path(self, item):
+        return item
+
+    def load(self, item):
+        with open(item, 'r') as file:
+            data = json.load(file)
+        if self.article_store is not None:
+            self.article_store.resolve_assignment(data)
+        return data
+
+    def records(self):
+        for item, _, _ in self.entries():
+            yield self.load(item)
+
+    def frame(self, columns):
+        rows = []
+        for data in self.records():
+            rows.append({column: data.get(column) for column in columns})
+        return pd.DataFrame(rows, columns=list(columns))
+
+
+class ColumnarSource:
+    # All assignments in one Parquet (.parquet) or Arrow (.feather, .arrow) file.
+    # Columns are read on first use, so the article texts are only loaded
+    # when an assignment actually has to be evaluated.
+    def __init__(self, path, memory_map=True, article_store=None):
+        self.path = path
+        self.memory_map = memory_map
+        self.article_store = article_store
+        self._tables = {}
+
+    def __getstate__(self):
+        # Worker processes read the file themselves instead of receiving the tables
+        state = self.__dict__.copy()
+        state['_tables'] = {}
+        return state
+
+    def _read(self, columns=None):
+        key = tuple(columns) if columns is not None else None
+        if key not in self._tables:
+            columns = list(columns) if columns is not None else None
+            if self.path.endswith(('.feather', '.arrow')):
+                table = feather.read_table(self.path, columns=columns,
+                                           memory_map=self.memory_map)
+            else:
+                table = pq.read_table(self.path, columns=columns,
+                                      memory_map=self.memory_map)
+            self._tables[key] = table
+        return self._tables[key]
+
+    def entries(self):
+        columns = self._read(KEY_COLUMNS).to_pydict()
+        path = os.path.abspath(self.path)
+        entries = []
+        for index, values in enumerate(zip(*(columns[column] for column in KEY_COLUMNS))):
+            key = hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+            entries.append((index, f"{path}#{values[0]}", key))
+        return entries
+
+    def file_path(self, item):
+        return self.path
+
+    def _assignment(self, row):
+        data = assignment_from_row(row)
+        if self.article_store is not None:
+            self.article_store.resolve_assignment(data)
+        return data
+
+    def load(self, item):
+        return self._assignment(self._read().slice(item, 1).to_pylist()[0])
+
+    def records(self):
+        for row in self._read().to_pylist():
+            yield self._assignment(row)
+
+    def frame(self, columns):
+        return self._read(columns).to_pandas()
+
+
+def open_source(path, article_store=None):
+    # Accepts a source, a folder of JSON files or a columnar file
+    if isinstance(path, (JsonFolderSource, ColumnarSource)):
+        return path
+    if os.path.isdir(path):
+        return JsonFolderSource(path, article_store=article_store)
+    return ColumnarSource(path, article_store=article_store)
@@ -1,49 +1,75 @@
-﻿import os
-import json
+﻿import json
+from VerdictCache import VerdictCache
+from AssignmentSource import JsonFolderSource, open_source, duration_to_minutes
+from WorkerStats import WorkerStats, DEFAULT_BAN_POLICY
+
+# Bump whenever the fields read from the assignment files change
+CACHE_VERSION = 'BanFilter-1'
+
+# The only fields the ban rule needs
+BAN_COLUMNS = ['WorkerId', 'Duration']
 
 
 class BanFilter:
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, cache_path=None, policy=DEFAULT_BAN_POLICY,
+                 short_duration=5):
+        # folder_path is a folder of JSON files or a Parquet/Arrow file of assignments
         self.folder_path = folder_path
+        self.cache_path = cache_path
+        # policy selects the workers to ban from the WorkerStats table
+        self.policy = policy
+        self.short_duration = short_duration
+        self.source = open_source(folder_path)
 
     def convert_to_minutes(self, duration_str):
-        parts = duration_str.split(' ')  # Split '0 days' from '00:13:14'
-        time_part = parts[-1]  # Get the '00:13:14' part
-        # Split into hours, minutes, and seconds
-        h, m, s = map(int, time_part.split(':'))
-        return h * 60 + m + s / 60  # Convert to total minutes
+        return duration_to_minutes(duration_str)
+
+    def _read_assignment(self, file_path):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        return {"WorkerId": data["WorkerId"], "Duration": data["Duration"]}
+
+    def read_assignments(self):
+        if not isinstance(self.source, JsonFolderSource):
+            # A columnar source reads just the two columns, the texts are never loaded
+            return self.source.frame(BAN_COLUMNS).to_dict('records')
+
+        cache = None
+        if self.cache_path is not None:
+            cache = VerdictCache(self.cache_path, CACHE_VERSION)
+
+        assignments = []
+        file_paths = []
+        for file_path, _, key in self.source.entries():
+            file_paths.append(file_path)
+            if cache is None:
+                assignments.append(self._read_assignment(file_path))
+                continue
+
+            # Only new or changed files are opened, the rest come from the cache
+            assignment = cache.get(file_path, key)
+            if assignment is None:
+                assignment = self._read_assignment(file_path)
+                cache.put(file_path, key, assignment)
+            assignments.append(assignment)
+
+        if cache is not None:
+            cache.prune(file_paths)
+            cache.save()
+        return assignments
+
+    def worker_stats(self, verdicts=None):
+        # Pass the verdicts of AssignmentFilter to include rejection rates and rule failures
+        return WorkerStats(self.read_assignments(), verdicts,
+                           short_duration=self.short_duration)
 
     def filter_assignments(self):
-        workerID = {}
-
-        for file_name in os.listdir(self.folder_path):
-            if file_name.endswith('.json'):
-                with open(os.path.join(self.folder_path, file_name), 'r') as file:
-                    data = json.load(file)
-
-                    duration_minutes = self.convert_to_minutes(
-                        data['Duration'])
-
-                    if duration_minutes <= 5:
-
-                        if data["WorkerId"] in workerID:
-                            workerID[data["WorkerId"]] += 1
-
-                        else:
-                            workerID[data["WorkerId"]] = 1
-
-        return workerID
-
-    def get_worker_ids(self):
-
-        workerIDs = []
-        filtered_worker_ids = self.filter_assignments()
-
-        for worker, job_count in filtered_worker_ids.items():
-            if job_count >= 10:
-                workerIDs.append(worker)
+        # Number of assignments of at most short_duration minutes per worker
+        short = self.worker_stats().table['ShortAssignments']
+        return {worker: int(count) for worker, count in short[short > 0].items()}
 
-        return workerIDs
+    def get_worker_ids(self, verdicts=None):
+        return self.worker_stats(verdicts).ban(self.policy)
 
 
 # Usage
@@ -0,0 +1,145 @@
+import os
+import json
+import datetime
+import threading
+import concurrent.futures
+from MTurkClient import wrap_client
+from mturk_helpers import REJECT_FEEDBACK, APPROVE_FEEDBACK, BLOCK_REASON
+
+# Actions recorded in the journal, organize marks the files copied by HITOrganizer
+APPROVE = "approve"
+REJECT = "reject"
+BLOCK = "block"
+ORGANIZE = "organize"
+
+
+class DecisionExecutor:
+    # Sends approve, reject and block calls concurrently and appends every
+    # outcome to a JSONL journal. Actions the journal records as done are
+    # skipped on the next run, so a batch that failed halfway can be re-run.
+    def __init__(
+        self, mturk_client, journal_path, hit_organizer=None, max_workers=None
+    ):
+        self.mturk_client = wrap_client(mturk_client)
+        self.journal_path = journal_path
+        self.hit_organizer = hit_organizer
+        self.max_workers = max_workers or self.mturk_client.max_concurrency
+        self.lock = threading.Lock()
+        self.done = self._load_journal()
+
+    def _load_journal(self):
+        done = {}
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash is ignored
+                        continue
+                    if entry.get("Status") == "done":
+                        done[(entry["Action"], entry["Id"])] = entry
+        except FileNotFoundError:
+            pass
+        return done
+
+    def _record(self, action, item_id, status, error=None):
+        entry = {
+            "Action": action,
+            "Id": item_id,
+            "Status": status,
+            "Time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        if error is not None:
+            entry["Error"] = error
+        with self.lock:
+            directory = os.path.dirname(self.journal_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as journal:
+                journal.write(json.dumps(entry) + "\n")
+            if status == "done":
+                self.done[(action, item_id)] = entry
+
+    def is_done(self, action, item_id):
+        return (action, item_id) in self.done
+
+    def _call(self, action, item_id):
+        if action == APPROVE:
+            self.mturk_client.approve_assignment(
+                AssignmentId=item_id,
+                RequesterFeedback=APPROVE_FEEDBACK,
+                OverrideRejection=False,
+            )
+        elif action == REJECT:
+            self.mturk_client.reject_assignment(
+                AssignmentId=item_id, RequesterFeedback=REJECT_FEEDBACK
+            )
+        elif action == BLOCK:
+            self.mturk_client.create_worker_block(WorkerId=item_id, Reason=BLOCK_REASON)
+        else:
+            raise ValueError("Unknown action %s" % action)
+
+    def _run(self, action, item_id):
+        try:
+            self._call(action, item_id)
+        except Exception as e:
+            self._record(action, item_id, "failed", str(e))
+            print(f"Error: {action} {item_id}: {e}")
+            return False
+        self._record(action, item_id, "done")
+        return True
+
+    def execute(self, approved=(), rejected=(), blocked=()):
+        actions = (
+            [(APPROVE, assignment_id) for assignment_id in approved]
+            + [(REJECT, assignment_id) for assignment_id in rejected]
+            + [(BLOCK, worker_id) for worker_id in blocked]
+        )
+        pending = list(dict.fromkeys(a for a in actions if not self.is_done(*a)))
+        summary = {"done": 0, "skipped": len(actions) - len(pending), "failed": []}
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            futures = {
+                executor.submit(self._run, *action): action for action in pending
+            }
+            for future in concurrent.futures.as_completed(futures):
+                if future.result():
+                    summary["done"] += 1
+                else:
+                    summary["failed"].append(futures[future])
+
+        summary["organized"], summary["missing"] = self.organize()
+        print(
+            f"Done {summary['done']} actions, skipped {summary['skipped']} "
+            f"already done, {len(summary['failed'])} failed."
+        )
+        return summary
+
+    def organize(self):
+        # Copies the files of every reviewed assignment in one bulk step,
+        # including those reviewed in an earlier run that stopped before this point
+        if self.hit_organizer is None:
+            return [], []
+        decisions = {
+            item_id: action == APPROVE
+            for action, item_id in list(self.done)
+            if action in (APPROVE, REJECT) and not self.is_done(ORGANIZE, item_id)
+        }
+        if not decisions:
+            return [], []
+        organized, missing = self.hit_organizer.organize_many(decisions)
+        for assignment_id in organized:
+            self._record(ORGANIZE, assignment_id, "done")
+        return organized, missing
+
+
+# Usage
+
+"""
+executor = DecisionExecutor(mturk, 'mturk_cache/decisions.jsonl', hit_organizer)
+summary = executor.execute(approved=approved_ids, rejected=rejected_ids, blocked=worker_ids)
+print(summary["failed"])
+"""
@@ -0,0 +1,334 @@
+import os
+import json
+import hashlib
+import sqlite3
+import datetime
+import threading
+from ArticleStore import ArticleStore, REFERENCE_PREFIX
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hits (
+    HITId TEXT PRIMARY KEY,
+    Expiration TEXT NOT NULL,
+    NumberOfAssignmentsAvailable INTEGER NOT NULL,
+    NumberOfAssignmentsPending INTEGER NOT NULL,
+    QuestionHash TEXT,
+    CreationTime TEXT,
+    NumberOfAssignmentsCompleted INTEGER
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    AssignmentId TEXT PRIMARY KEY,
+    HITId TEXT NOT NULL,
+    AssignmentStatus TEXT,
+    AcceptTime TEXT,
+    SubmitTime TEXT,
+    Duration REAL,
+    WorkerId TEXT,
+    Answer TEXT,
+    QuestionHash TEXT
+);
+CREATE INDEX IF NOT EXISTS assignments_by_hit ON assignments (HITId);
+CREATE TABLE IF NOT EXISTS questions (
+    QuestionHash TEXT PRIMARY KEY,
+    Question TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    Key TEXT PRIMARY KEY,
+    Value TEXT
+);
+"""
+
+HIT_COLUMNS = (
+    "HITId",
+    "Expiration",
+    "NumberOfAssignmentsAvailable",
+    "NumberOfAssignmentsPending",
+    "QuestionHash",
+    "CreationTime",
+    "NumberOfAssignmentsCompleted",
+)
+
+# Columns added after the first version of the schema
+ADDED_HIT_COLUMNS = {
+    "CreationTime": "TEXT",
+    "NumberOfAssignmentsCompleted": "INTEGER",
+}
+
+ASSIGNMENT_COLUMNS = (
+    "HITId",
+    "AssignmentId",
+    "AssignmentStatus",
+    "AcceptTime",
+    "SubmitTime",
+    "Duration",
+    "WorkerId",
+    "Answer",
+    "QuestionHash",
+)
+
+
+def question_hash(question_xml):
+    return hashlib.sha1(question_xml.encode("utf-8")).hexdigest()
+
+
+def _duration_seconds(duration):
+    if isinstance(duration, datetime.timedelta):
+        return duration.total_seconds()
+    return duration
+
+
+class HITCache:
+    def __init__(self, db_path, article_store=None):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Question forms are stored with their article bodies replaced by
+        # references, by default to an articles table in the same database
+        self.articles = article_store or ArticleStore(db_path)
+        # One connection shared by all threads, every access goes through the lock
+        self.connection = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+            existing = {
+                row[1] for row in self.connection.execute("PRAGMA table_info(hits)")
+            }
+            for column, column_type in ADDED_HIT_COLUMNS.items():
+                if column not in existing:
+                    self.connection.execute(
+                        "ALTER TABLE hits ADD COLUMN %s %s" % (column, column_type)
+                    )
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+        self.articles.close()
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def get(self, hit_id):
+        rows = self._query("SELECT * FROM hits WHERE HITId = ?", (hit_id,))
+        return dict(rows[0]) if rows else None
+
+    def hits(self):
+        return [dict(row) for row in self._query("SELECT * FROM hits")]
+
+    def hit_ids(self, created_after=None):
+        # HITs imported from hit_data.json may have no CreationTime, they are kept
+        if created_after is None:
+            rows = self._query("SELECT HITId FROM hits")
+        else:
+            rows = self._query(
+                "SELECT HITId FROM hits WHERE CreationTime IS NULL OR CreationTime > ?",
+                (created_after,),
+            )
+        return [row[0] for row in rows]
+
+    def incomplete_hit_ids(self):
+        # HITs missing a column added after the first schema version
+        rows = self._query(
+            "SELECT HITId FROM hits WHERE %s"
+            % " OR ".join("%s IS NULL" % column for column in ADDED_HIT_COLUMNS)
+        )
+        return [row[0] for row in rows]
+
+    def mark_finished(self, hit_ids):
+        # HITs MTurk no longer has, they can take no more workers
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "UPDATE hits SET NumberOfAssignmentsAvailable = 0, "
+                    "NumberOfAssignmentsPending = 0 WHERE HITId = ?",
+                    [(hit_id,) for hit_id in hit_ids],
+                )
+
+    def backfill_hits(self, hits):
+        # Fills the added columns that are still NULL from listed HITs,
+        # values already stored are kept
+        updates = ", ".join(
+            "%s = COALESCE(%s, ?)" % (column, column) for column in ADDED_HIT_COLUMNS
+        )
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "UPDATE hits SET %s WHERE HITId = ?" % updates,
+                    [
+                        [hit.get(column) for column in ADDED_HIT_COLUMNS] + [hit["HITId"]]
+                        for hit in hits
+                    ],
+                )
+
+    def open_hit_ids(self, now):
+        # A HIT is finished once nothing is pending, it can take no more workers
+        # and every assignment has been reviewed
+        rows = self._query(
+            """
+            SELECT HITId FROM hits
+            WHERE NOT (
+                NumberOfAssignmentsPending = 0
+                AND (Expiration < ? OR NumberOfAssignmentsAvailable = 0)
+                AND NOT EXISTS (
+                    SELECT 1 FROM assignments
+                    WHERE assignments.HITId = hits.HITId
+                    AND assignments.AssignmentStatus = 'Submitted'
+                )
+            )
+            """,
+            (now,),
+        )
+        return [row[0] for row in rows]
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM hits")[0][0]
+
+    def __contains__(self, hit_id):
+        return self.get(hit_id) is not None
+
+    def question(self, question_hash):
+        rows = self._query(
+            "SELECT Question FROM questions WHERE QuestionHash = ?", (question_hash,)
+        )
+        return self.articles.expand_question_xml(rows[0][0]) if rows else None
+
+    def questions(self, question_hashes=None):
+        if question_hashes is None:
+            rows = self._query("SELECT QuestionHash, Question FROM questions")
+        else:
+            question_hashes = list(set(question_hashes))
+            rows = []
+            # Stay below SQLite's limit on the number of parameters
+            for i in range(0, len(question_hashes), 500):
+                chunk = question_hashes[i : i + 500]
+                rows.extend(
+                    self._query(
+                        "SELECT QuestionHash, Question FROM questions WHERE QuestionHash IN (%s)"
+                        % ",".join("?" * len(chunk)),
+                        chunk,
+                    )
+                )
+        return {row[0]: self.articles.expand_question_xml(row[1]) for row in rows}
+
+    def get_assignments(self, hit_ids=None, with_answer=True):
+        # The Answer XML is only read when asked for
+        columns = [c for c in ASSIGNMENT_COLUMNS if with_answer or c != "Answer"]
+        sql = "SELECT %s FROM assignments" % ", ".join(columns)
+        if hit_ids is None:
+            rows = self._query(sql)
+        else:
+            hit_ids = list(hit_ids)
+            rows = []
+            for i in range(0, len(hit_ids), 500):
+                chunk = hit_ids[i : i + 500]
+                rows.extend(
+                    self._query(
+                        sql + " WHERE HITId IN (%s)" % ",".join("?" * len(chunk)),
+                        chunk,
+                    )
+                )
+        assignments = []
+        for row in rows:
+            assignment = dict(row)
+            if assignment["Duration"] is not None:
+                assignment["Duration"] = datetime.timedelta(
+                    seconds=assignment["Duration"]
+                )
+            assignments.append(assignment)
+        return assignments
+
+    def upsert_hit(self, hit, assignments, question_xml=None):
+        # The HIT, its question and its assignments are committed atomically,
+        # the articles of the question are stored first
+        if question_xml is not None:
+            question_xml = self.articles.compact_question_xml(question_xml)
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                if question_xml is not None:
+                    self.connection.execute(
+                        "INSERT OR IGNORE INTO questions (QuestionHash, Question) VALUES (?, ?)",
+                        (hit["QuestionHash"], question_xml),
+                    )
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO hits (%s) VALUES (%s)"
+                    % (", ".join(HIT_COLUMNS), ",".join("?" * len(HIT_COLUMNS))),
+                    [hit.get(column) for column in HIT_COLUMNS],
+                )
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO assignments (%s) VALUES (%s)"
+                    % (
+                        ", ".join(ASSIGNMENT_COLUMNS),
+                        ",".join("?" * len(ASSIGNMENT_COLUMNS)),
+                    ),
+                    [
+                        [
+                            _duration_seconds(assignment.get(column))
+                            if column == "Duration"
+                            else assignment.get(column)
+                            for column in ASSIGNMENT_COLUMNS
+                        ]
+                        for assignment in assignments
+                    ],
+                )
+
+    def compact(self):
+        # Moves the article bodies of questions stored in full to the articles table
+        rows = self._query(
+            "SELECT QuestionHash, Question FROM questions WHERE Question NOT LIKE ?",
+            ("%<![CDATA[" + REFERENCE_PREFIX + "%",),
+        )
+        updates = []
+        for key, question_xml in rows:
+            compact_xml = self.articles.compact_question_xml(question_xml)
+            if compact_xml != question_xml:
+                updates.append((compact_xml, key))
+        with self.lock:
+            with self.connection:
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "UPDATE questions SET Question = ? WHERE QuestionHash = ?", updates
+                )
+        return len(updates)
+
+    def get_meta(self, key, default=None):
+        rows = self._query("SELECT Value FROM meta WHERE Key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (Key, Value) VALUES (?, ?)",
+                (key, json.dumps(value)),
+            )
+
+    def import_json(self, cache, questions=None):
+        # Import a cache in the old hit_data.json layout
+        questions = dict(questions or {})
+        for hit_id, hit_data in cache.items():
+            assignments = []
+            for assignment in hit_data.get("Data", []):
+                assignment = dict(assignment)
+                if "Question" in assignment:
+                    question_xml = assignment.pop("Question")
+                    assignment["QuestionHash"] = question_hash(question_xml)
+                    questions.setdefault(assignment["QuestionHash"], question_xml)
+                assignments.append(assignment)
+            hit = {
+                "HITId": hit_id,
+                "Expiration": hit_data["Expiration"],
+                "NumberOfAssignmentsAvailable": hit_data["NumberOfAssignmentsAvailable"],
+                "NumberOfAssignmentsPending": hit_data["NumberOfAssignmentsPending"],
+                "QuestionHash": hit_data.get("QuestionHash")
+                or (assignments[0]["QuestionHash"] if assignments else None),
+            }
+            question_xml = questions.get(hit["QuestionHash"])
+            self.upsert_hit(hit, assignments, question_xml)
@@ -0,0 +1,267 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+import concurrent.futures
+from decimal import Decimal, ROUND_HALF_UP
+from botocore.exceptions import ClientError, BotoCoreError
+from MTurkClient import wrap_client
+from mturk_helpers import hit_parameters, HIT_REWARD
+
+# MTurk commission on rewards, HITs with 10 or more assignments pay the higher rate
+FEE_RATE = Decimal("0.20")
+LARGE_HIT_FEE_RATE = Decimal("0.40")
+LARGE_HIT_ASSIGNMENTS = 10
+
+# MTurk's error for a UniqueRequestToken it has already seen, within 24 hours
+HIT_ALREADY_EXISTS = "AWS.MechanicalTurk.HitAlreadyExists"
+
+
+def is_hit_already_exists(error):
+    if not isinstance(error, ClientError):
+        return False
+    if error.response.get("TurkErrorCode") == HIT_ALREADY_EXISTS:
+        return True
+    details = error.response.get("Error", {})
+    return details.get("Code") == "RequestError" and "HitAlreadyExists" in details.get(
+        "Message", ""
+    )
+
+
+def load_manifest(manifest_path):
+    # Reads the JSONL manifest written by process_directory_in_chunks
+    with open(manifest_path, "r", encoding="utf-8") as manifest:
+        return [json.loads(line) for line in manifest if line.strip()]
+
+
+def manifest_from_directory(directory):
+    # One entry per HIT XML file, in the order the files were generated
+    return [
+        {"Hit": os.path.splitext(name)[0], "XMLFile": os.path.join(directory, name)}
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".xml")
+    ]
+
+
+def manifest_from_coverage(questions_data, target_assignments=2):
+    # One entry per question of retrieve_and_count_questions that is still short
+    return [
+        {
+            "Hit": os.path.splitext(os.path.basename(data["xml_file"]))[0],
+            "XMLFile": data["xml_file"],
+            "MaxAssignments": target_assignments - data["total_count"],
+        }
+        for data in questions_data.values()
+        if "xml_file" in data and data["total_count"] < target_assignments
+    ]
+
+
+def hit_cost(reward, max_assignments):
+    reward = Decimal(reward) * max_assignments
+    rate = LARGE_HIT_FEE_RATE if max_assignments >= LARGE_HIT_ASSIGNMENTS else FEE_RATE
+    fee = (reward * rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    return reward, fee
+
+
+class HITDeployer:
+    # Creates the HITs of a manifest concurrently and records every created
+    # HIT in a JSONL ledger. Each entry is sent with a UniqueRequestToken
+    # derived from its question, which is also stored as the HIT's
+    # RequesterAnnotation. MTurk only rejects a repeated token for 24 hours,
+    # so before posting, pending tokens are looked up among the listed HITs
+    # and a HIT created by a run that crashed before recording it is
+    # recorded instead of posted again.
+    def __init__(
+        self,
+        mturk_client,
+        ledger_path,
+        qualification_type_id,
+        max_assignments=2,
+        reward=HIT_REWARD,
+        batch="",
+        max_workers=None,
+    ):
+        self.mturk_client = wrap_client(mturk_client)
+        self.ledger_path = ledger_path
+        self.qualification_type_id = qualification_type_id
+        self.max_assignments = max_assignments
+        self.reward = reward
+        # Change batch to post the same questions again on purpose
+        self.batch = batch
+        self.max_workers = max_workers or self.mturk_client.max_concurrency
+        self.lock = threading.Lock()
+        self.created = self._load_ledger()
+
+    def _load_ledger(self):
+        created = {}
+        try:
+            with open(self.ledger_path, "r", encoding="utf-8") as ledger:
+                for line in ledger:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("Status") in ("created", "duplicate"):
+                        created[entry["Token"]] = entry
+        except FileNotFoundError:
+            pass
+        return created
+
+    def _record(self, entry):
+        entry["Time"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self.lock:
+            directory = os.path.dirname(self.ledger_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.ledger_path, "a", encoding="utf-8") as ledger:
+                ledger.write(json.dumps(entry) + "\n")
+            if entry["Status"] in ("created", "duplicate"):
+                self.created[entry["Token"]] = entry
+
+    def _question_xml(self, entry):
+        if "Question" in entry:
+            return entry["Question"]
+        with open(entry["XMLFile"], "r") as file:
+            return file.read()
+
+    def _max_assignments(self, entry):
+        return entry.get("MaxAssignments", self.max_assignments)
+
+    def token(self, question_xml, max_assignments):
+        # MTurk accepts tokens of up to 64 characters
+        key = f"{self.batch}:{max_assignments}:{question_xml}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _pending(self, entries):
+        pending = []
+        for entry in entries:
+            question_xml = self._question_xml(entry)
+            max_assignments = self._max_assignments(entry)
+            token = self.token(question_xml, max_assignments)
+            if token not in self.created:
+                pending.append((entry, question_xml, max_assignments, token))
+        return pending
+
+    def plan(self, entries, limit=None):
+        # Dry run: the HITs deploy would post and their cost, MTurk is not called
+        pending = self._pending(entries)
+        already_created = len(entries) - len(pending)
+        pending = pending[:limit]
+        rewards = fees = Decimal("0.00")
+        assignments = 0
+        for _, _, max_assignments, _ in pending:
+            reward, fee = hit_cost(self.reward, max_assignments)
+            rewards += reward
+            fees += fee
+            assignments += max_assignments
+        return {
+            "HITs": len(pending),
+            "Assignments": assignments,
+            "AlreadyCreated": already_created,
+            "Reward": str(rewards),
+            "Fees": str(fees),
+            "TotalCost": str(rewards + fees),
+        }
+
+    def posted_hits(self):
+        # Token -> HIT of every listed HIT created by a HITDeployer
+        return {
+            hit["RequesterAnnotation"]: hit
+            for hit in self.mturk_client.paginate("list_hits", "HITs", MaxResults=100)
+            if hit.get("RequesterAnnotation")
+        }
+
+    def _new_record(self, entry, max_assignments, token):
+        return {
+            "Token": token,
+            "Hit": entry.get("Hit"),
+            "XMLFile": entry.get("XMLFile"),
+            "MaxAssignments": max_assignments,
+        }
+
+    def _record_duplicate(self, record, hit):
+        record["Status"] = "duplicate"
+        if hit is not None:
+            record["HITId"] = hit["HITId"]
+            record["HITGroupId"] = hit.get("HITGroupId")
+        self._record(record)
+        return record
+
+    def _create(self, entry, question_xml, max_assignments, token):
+        record = self._new_record(entry, max_assignments, token)
+        try:
+            response = self.mturk_client.create_hit(
+                UniqueRequestToken=token,
+                RequesterAnnotation=token,
+                **hit_parameters(
+                    question_xml,
+                    self.qualification_type_id,
+                    max_assignments=max_assignments,
+                    reward=self.reward,
+                ),
+            )
+        except ClientError as e:
+            record["Error"] = str(e)
+            if is_hit_already_exists(e):
+                # Created by another run since the HITs were listed
+                print(f"HIT for {record['Hit']} already exists.")
+                return self._record_duplicate(record, self.posted_hits().get(token))
+            record["Status"] = "failed"
+            self._record(record)
+            print(f"An error occurred while creating HIT for {record['Hit']}: {e}")
+            return record
+        except BotoCoreError as e:
+            record["Status"] = "failed"
+            record["Error"] = str(e)
+            self._record(record)
+            print(f"An error occurred while creating HIT for {record['Hit']}: {e}")
+            return record
+        record["Status"] = "created"
+        record["HITId"] = response["HIT"]["HITId"]
+        record["HITGroupId"] = response["HIT"].get("HITGroupId")
+        self._record(record)
+        print(f"Created HIT with ID: {record['HITId']}")
+        return record
+
+    def deploy(self, entries, limit=None, dry_run=False, max_cost=None):
+        # limit caps the number of new HITs, entries in the ledger are skipped.
+        # With max_cost nothing is posted when the planned total exceeds it.
+        if dry_run:
+            return self.plan(entries, limit)
+        if max_cost is not None:
+            total_cost = Decimal(self.plan(entries, limit)["TotalCost"])
+            if total_cost > Decimal(str(max_cost)):
+                raise ValueError(
+                    f"Deployment costs {total_cost}, more than max_cost {max_cost}"
+                )
+        pending = self._pending(entries)[:limit]
+        records = []
+        if pending:
+            # HITs created by a run that crashed before recording them
+            posted = self.posted_hits()
+            unposted = []
+            for entry, question_xml, max_assignments, token in pending:
+                if token in posted:
+                    record = self._new_record(entry, max_assignments, token)
+                    records.append(self._record_duplicate(record, posted[token]))
+                else:
+                    unposted.append((entry, question_xml, max_assignments, token))
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers
+            ) as executor:
+                records += executor.map(lambda args: self._create(*args), unposted)
+        created = sum(1 for record in records if record["Status"] == "created")
+        print(f"Created {created} of {len(pending)} HITs.")
+        return records
+
+
+# Usage
+
+"""
+deployer = HITDeployer(mturk, 'mturk_cache/hit_ledger.jsonl', qualification_type_id)
+entries = manifest_from_directory(output_directory)
+print(deployer.deploy(entries, dry_run=True))
+# Run after checking the plan, nothing is posted above the budget
+records = deployer.deploy(entries, max_cost=2000)
+"""
@@ -5,9 +5,16 @@ from AssignmentFilter import AssignmentFilter
 
 
 class HITOrganizer:
-    def __init__(self, parsed_hits_dir, user_profiles_dir):
+    def __init__(self, parsed_hits_dir, user_profiles_dir, index_path=None, link=False):
         self.parsed_hits_dir = parsed_hits_dir
         self.user_profiles_dir = user_profiles_dir
+        # The index is stored without a .json suffix so the filters never pick it up
+        self.index_path = index_path or os.path.join(
+            parsed_hits_dir, '.assignment_index')
+        # Hardlinks are only safe if the parsed files are never rewritten in place
+        self.link = link
+        self._files = None
+        self._index = None
 
     def _extract_worker_id_and_assignment_id(self, file_path):
         worker_id, assignment_id = None, None
@@ -18,40 +25,116 @@ class HITOrganizer:
                 assignment_id = data.get('AssignmentId')
         return worker_id, assignment_id
 
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                self._files = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self._files = {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._files, file)
+        os.replace(tmp_path, self.index_path)
+
+    def update_index(self):
+        # Only files that are new or changed since the last update are opened
+        if self._files is None:
+            self._load_index()
+
+        files = {}
+        changed = False
+        with os.scandir(self.parsed_hits_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                mtime = entry.stat().st_mtime_ns
+                known = self._files.get(entry.name)
+                if known is not None and known['mtime'] == mtime:
+                    files[entry.name] = known
+                    continue
+                worker_id, assignment_id = self._extract_worker_id_and_assignment_id(
+                    entry.path)
+                files[entry.name] = {'mtime': mtime, 'WorkerId': worker_id,
+                                     'AssignmentId': assignment_id}
+                changed = True
+
+        if changed or len(files) != len(self._files):
+            self._files = files
+            self._save_index()
+
+        self._index = {}
+        for filename, entry in self._files.items():
+            if entry['AssignmentId'] is not None and entry['WorkerId'] is not None:
+                json_path = os.path.join(self.parsed_hits_dir, filename)
+                txt_path = json_path[:-len('.json')] + '.txt'
+                self._index[entry['AssignmentId']] = (
+                    entry['WorkerId'], json_path, txt_path)
+        return self._index
+
+    def lookup(self, assignment_id):
+        if self._index is None or assignment_id not in self._index:
+            self.update_index()
+        return self._index.get(assignment_id)
+
+    def _copy(self, src_path, target_dir_path):
+        dst_path = os.path.join(target_dir_path, os.path.basename(src_path))
+        if self.link:
+            try:
+                if os.path.exists(dst_path):
+                    os.remove(dst_path)
+                os.link(src_path, dst_path)
+                return
+            except OSError:
+                pass  # Different file system, fall back to copying
+        # copyfile uses the kernel's zero-copy path where available
+        shutil.copyfile(src_path, dst_path)
+
+    def _organize_entry(self, entry, approve):
+        worker_id, json_path, txt_path = entry
+        # Determine the target subfolder based on approval status
+        target_subfolder = 'approved' if approve else 'rejected'
+
+        # Create the WorkerId directory and subfolder if they don't exist
+        target_dir_path = os.path.join(
+            self.user_profiles_dir, worker_id, target_subfolder)
+        os.makedirs(target_dir_path, exist_ok=True)
+
+        # Copy the .json file and the corresponding .txt file to the target directory
+        self._copy(json_path, target_dir_path)
+        print(f"Copied '{os.path.basename(json_path)}' to '{target_dir_path}'")
+        if os.path.exists(txt_path):
+            self._copy(txt_path, target_dir_path)
+            print(f"Copied '{os.path.basename(txt_path)}' to '{target_dir_path}'")
+
     def organize_file(self, assignment_id, approve=True):
-        for filename in os.listdir(self.parsed_hits_dir):
-            if filename.endswith('.json'):
-                file_path = os.path.join(self.parsed_hits_dir, filename)
-                worker_id, file_assignment_id = self._extract_worker_id_and_assignment_id(
-                    file_path)
-
-                if assignment_id == file_assignment_id and worker_id is not None:
-                    # Determine the target subfolder based on approval status
-                    target_subfolder = 'approved' if approve else 'rejected'
-
-                    # Create the WorkerId directory and subfolder if they don't exist
-                    worker_dir_path = os.path.join(
-                        self.user_profiles_dir, worker_id)
-                    target_dir_path = os.path.join(
-                        worker_dir_path, target_subfolder)
-                    os.makedirs(target_dir_path, exist_ok=True)
-
-                    # Copy the .json file to the target directory
-                    shutil.copy(file_path, target_dir_path)
-                    print(f"Copied '{filename}' to '{target_dir_path}'")
-
-                    # Copy the corresponding .txt file to the target directory
-                    txt_filename = filename.replace('.json', '.txt')
-                    txt_file_path = os.path.join(
-                        self.parsed_hits_dir, txt_filename)
-                    if os.path.exists(txt_file_path):
-                        shutil.copy(txt_file_path, target_dir_path)
-                        print(
-                            f"Copied '{txt_filename}' to '{target_dir_path}'")
-                    return True
-
-        print("No matching file found for the given AssignmentId.")
-        return False
+        entry = self.lookup(assignment_id)
+        if entry is None:
+            print("No matching file found for the given AssignmentId.")
+            return False
+
+        self._organize_entry(entry, approve)
+        return True
+
+    def organize_many(self, decisions):
+        # decisions maps AssignmentId to True (approve) or False (reject)
+        if isinstance(decisions, dict):
+            decisions = decisions.items()
+
+        index = self.update_index()
+        organized, missing = [], []
+        for assignment_id, approve in decisions:
+            entry = index.get(assignment_id)
+            if entry is None:
+                missing.append(assignment_id)
+                continue
+            self._organize_entry(entry, approve)
+            organized.append(assignment_id)
+
+        if missing:
+            print(f"No matching file found for {len(missing)} AssignmentIds.")
+        return organized, missing
 
 
 if __name__ == '__main__':
@@ -71,5 +154,5 @@ if __name__ == '__main__':
     assignment_filter = AssignmentFilter(folder_path)
     filtered_assignment_ids = assignment_filter.filter_assignments()
 
-#    for assignment_id in filtered_assignment_ids:
- #       hit_organizer.organize_file(assignment_id, approve=False)
+    # Copy all rejected assignments in one sweep
+    # hit_organizer.organize_many({assignment_id: False for assignment_id in filtered_assignment_ids})
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import hashlib
+import concurrent.futures
+from collections import OrderedDict
+from text_helpers import normalize_text
+from langdetect import detect
+from langdetect import DetectorFactory
+DetectorFactory.seed = 0
+
+# Bump whenever the fast path changes so persisted languages are recomputed
+DETECTOR_REVISION = 1
+
+# Function words that are Norwegian (bokmål or nynorsk) but not Danish or Swedish
+NORWEGIAN_WORDS = {
+    "etter", "seg", "meg", "deg", "noe", "noen", "mye", "ble", "blitt", "sier",
+    "gjennom", "mellom", "hva", "opp", "uke", "nå", "ikkje", "kva",
+    "korleis", "frå", "berre", "nokre", "eit", "vart", "hjå",
+}
+
+# Function words shared with the other Scandinavian languages
+SCANDINAVIAN_WORDS = {
+    "og", "i", "på", "er", "det", "som", "en", "et", "til", "av", "for", "med",
+    "har", "ikke", "de", "den", "at", "om", "men", "var", "fra", "vil", "kan",
+    "skal", "også", "han", "hun", "jeg", "vi", "da", "når", "ut", "mot", "blir",
+    "bli", "sin", "sitt", "sine", "få", "får", "må", "være", "andre",
+}
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _detect(text):
+    try:
+        return detect(text)
+    except Exception:
+        # Most likely because a link was passed instead of text
+        return None
+
+
+class LanguageDetector:
+    def __init__(self, memo_path=None, max_size=100000, fast_path=True,
+                 min_norwegian_words=2, min_scandinavian_ratio=0.25):
+        self.memo_path = memo_path
+        self.max_size = max_size
+        self.fast_path = fast_path
+        self.min_norwegian_words = min_norwegian_words
+        self.min_scandinavian_ratio = min_scandinavian_ratio
+        self.memo = OrderedDict()
+        self.new_entries = {}
+        if memo_path is not None:
+            self.load()
+
+    def worker_copy(self):
+        # Same settings without the memo, worker processes hand their new
+        # entries back through pop_new_entries and never save
+        return LanguageDetector(max_size=self.max_size, fast_path=self.fast_path,
+                                min_norwegian_words=self.min_norwegian_words,
+                                min_scandinavian_ratio=self.min_scandinavian_ratio)
+
+    def version(self):
+        settings = [DETECTOR_REVISION, self.fast_path, self.min_norwegian_words,
+                    self.min_scandinavian_ratio]
+        return hashlib.sha1(json.dumps(settings).encode()).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.memo_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") == self.version():
+            self.memo.update(data.get("languages", {}))
+
+    def save(self):
+        self.new_entries = {}
+        if self.memo_path is None:
+            return
+        directory = os.path.dirname(self.memo_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.memo_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": self.version(), "languages": self.memo}, file)
+        os.replace(tmp_path, self.memo_path)
+
+    def _remember(self, key, language):
+        self.memo[key] = language
+        self.new_entries[key] = language
+        # Only bound the memo when it is not persisted
+        if self.memo_path is None and len(self.memo) > self.max_size:
+            self.memo.popitem(last=False)
+
+    def _lookup(self, key):
+        if key in self.memo:
+            self.memo.move_to_end(key)
+            return True, self.memo[key]
+        return False, None
+
+    def pop_new_entries(self):
+        new_entries, self.new_entries = self.new_entries, {}
+        return new_entries
+
+    def update(self, languages):
+        for key, language in languages.items():
+            self._remember(key, language)
+
+    def is_obviously_norwegian(self, text):
+        words = WORD_PATTERN.findall(text.lower())
+        if not words:
+            return False
+        norwegian = {word for word in words if word in NORWEGIAN_WORDS}
+        if len(norwegian) < self.min_norwegian_words:
+            return False
+        scandinavian = sum(1 for word in words
+                           if word in NORWEGIAN_WORDS or word in SCANDINAVIAN_WORDS)
+        return scandinavian / len(words) >= self.min_scandinavian_ratio
+
+    def _detect_normalized(self, text):
+        if self.fast_path and self.is_obviously_norwegian(text):
+            return "no"
+        return _detect(text)
+
+    def detect(self, text):
+        key = text_key(text)
+        found, language = self._lookup(key)
+        if not found:
+            language = self._detect_normalized(normalize_text(text))
+            self._remember(key, language)
+        return language
+
+    def detect_many(self, texts, max_workers=1):
+        keys = [text_key(text) for text in texts]
+        languages = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            found, language = self._lookup(key)
+            if found:
+                languages[key] = language
+            elif key not in missing:
+                missing[key] = normalize_text(text)
+
+        if missing:
+            if max_workers == 1 or len(missing) < 2:
+                detected = map(self._detect_normalized, missing.values())
+                for key, language in zip(missing, detected):
+                    self._remember(key, language)
+                    languages[key] = language
+            else:
+                # The workers only need the settings, not the memo
+                detector = LanguageDetector(
+                    fast_path=self.fast_path, min_norwegian_words=self.min_norwegian_words,
+                    min_scandinavian_ratio=self.min_scandinavian_ratio)
+                with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    detected = executor.map(detector._detect_normalized, missing.values(),
+                                            chunksize=max(1, len(missing) // 64))
+                    for key, language in zip(missing, detected):
+                        self._remember(key, language)
+                        languages[key] = language
+
+        return [languages[key] for key in keys]
+
+    def is_norwegian(self, text):
+        return self.detect(text) == "no"
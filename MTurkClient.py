@@ -0,0 +1,257 @@
+import time
+import random
+import asyncio
+import warnings
+import functools
+import threading
+import concurrent.futures
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, BotoCoreError
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "Throttling",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+}
+
+DEFAULT_CONCURRENCY = 20
+
+# Attribute of a raw client holding the MTurkClient that wraps it
+WRAPPER_ATTRIBUTE = "_mturk_client_wrapper"
+
+# Client attributes that are passed through without rate limiting
+PASSTHROUGH_ATTRIBUTES = {
+    "exceptions", "meta", "can_paginate", "get_paginator", "get_waiter", "close",
+}
+
+
+def is_throttling_error(error):
+    if not isinstance(error, ClientError):
+        return False
+    details = error.response.get("Error", {})
+    if details.get("Code") in THROTTLING_ERROR_CODES:
+        return True
+    # MTurk reports some rate limits as a RequestError
+    return "rate" in details.get("Message", "").lower() and "exceed" in details.get("Message", "").lower()
+
+
+def is_read_operation(operation):
+    return operation.startswith("get_") or operation.startswith("list_")
+
+
+def client_config(max_concurrency, config=None):
+    # Size the connection pool to the concurrency and leave retries to MTurkClient
+    managed = Config(max_pool_connections=max_concurrency, retries={"total_max_attempts": 1})
+    return config.merge(managed) if config is not None else managed
+
+
+def pool_size(client):
+    # Connections of a boto3 client, None for other objects such as a local fake
+    config = getattr(getattr(client, "meta", None), "config", None)
+    return getattr(config, "max_pool_connections", None) if isinstance(config, Config) else None
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, min_rate=0.5, recovery=0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self):
+        # Halve the rate on throttling and recover it additively on success
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class AsyncMTurkClient:
+    def __init__(self, client):
+        self._client = client
+
+    async def call(self, operation, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._client.executor, functools.partial(self._client.call, operation, **kwargs))
+
+    async def paginate(self, operation, result_key, **kwargs):
+        next_token = None
+        while True:
+            if next_token:
+                kwargs["NextToken"] = next_token
+            response = await self.call(operation, **kwargs)
+            for item in response.get(result_key, []):
+                yield item
+            next_token = response.get("NextToken")
+            if not next_token:
+                break
+
+    def __getattr__(self, operation):
+        if operation.startswith("_"):
+            raise AttributeError(operation)
+        return functools.partial(self.call, operation)
+
+
+class MTurkClient:
+    def __init__(self, client=None, max_concurrency=DEFAULT_CONCURRENCY,
+                 requests_per_second=10, max_retries=5, base_delay=0.5, **client_kwargs):
+        # client can be a boto3 client or any object with its methods, such as a
+        # local fake. A client passed in is used as it is, with its own pool and
+        # retries, so only the client built here gets the tuned pool.
+        self.max_concurrency = max_concurrency
+        if client is None:
+            client = boto3.client("mturk", config=client_config(max_concurrency),
+                                  **client_kwargs)
+        self.client = client
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.aio = AsyncMTurkClient(self)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency)
+            return self._executor
+
+    def _should_retry(self, operation, error):
+        if is_throttling_error(error):
+            # Throttled requests were never executed, so they are safe to retry
+            self.rate_limiter.throttled()
+            return True
+        if not is_read_operation(operation):
+            return False
+        if isinstance(error, ClientError):
+            return error.response.get("Error", {}).get("Code") == "ServiceFault"
+        return isinstance(error, BotoCoreError)
+
+    def call(self, operation, **kwargs):
+        method = getattr(self.client, operation)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                response = method(**kwargs)
+            except (ClientError, BotoCoreError) as error:
+                if attempt >= self.max_retries or not self._should_retry(operation, error):
+                    raise
+                attempt += 1
+                time.sleep(self.base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                continue
+            self.rate_limiter.succeeded()
+            return response
+
+    def pages(self, operation, **kwargs):
+        next_token = None
+        while True:
+            if next_token:
+                kwargs["NextToken"] = next_token
+            response = self.call(operation, **kwargs)
+            yield response
+            next_token = response.get("NextToken")
+            if not next_token:
+                break
+
+    def paginate(self, operation, result_key, **kwargs):
+        for response in self.pages(operation, **kwargs):
+            yield from response.get(result_key, [])
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __getattr__(self, name):
+        if "client" not in self.__dict__:
+            raise AttributeError(name)
+        attribute = getattr(self.client, name)
+        if name.startswith("_") or name in PASSTHROUGH_ATTRIBUTES or not callable(attribute):
+            return attribute
+        return functools.partial(self.call, name)
+
+
+def wrap_client(mturk_client, max_concurrency=None, **kwargs):
+    # A raw client is wrapped once and the wrapper is kept on it, so every
+    # helper called with the same client shares one rate limit. Its threads
+    # are capped at the client's connection pool, build an MTurkClient for more.
+    if isinstance(mturk_client, MTurkClient):
+        return mturk_client
+    wrapper = getattr(mturk_client, WRAPPER_ATTRIBUTE, None)
+    if isinstance(wrapper, MTurkClient):
+        if max_concurrency is not None and max_concurrency != wrapper.max_concurrency:
+            warnings.warn(
+                f"The client is already wrapped with max_concurrency="
+                f"{wrapper.max_concurrency}, max_concurrency={max_concurrency} is ignored"
+            )
+        return wrapper
+    connections = pool_size(mturk_client)
+    if max_concurrency is None:
+        max_concurrency = min(DEFAULT_CONCURRENCY, connections or DEFAULT_CONCURRENCY)
+    elif connections is not None and max_concurrency > connections:
+        warnings.warn(
+            f"The client has {connections} connections, max_concurrency is capped at it. "
+            f"Use MTurkClient(max_concurrency={max_concurrency}, ...) for a larger pool."
+        )
+        max_concurrency = connections
+    wrapper = MTurkClient(client=mturk_client, max_concurrency=max_concurrency, **kwargs)
+    try:
+        setattr(mturk_client, WRAPPER_ATTRIBUTE, wrapper)
+    except AttributeError:
+        pass
+    return wrapper
+
+
+# Usage
+
+"""
+mturk = MTurkClient(max_concurrency=40, region_name='us-east-1',
+                    endpoint_url='https://mturk-requester-sandbox.us-east-1.amazonaws.com')
+hits = list(mturk.paginate('list_hits', 'HITs', MaxResults=100))
+
+# Any object with the client's methods can stand in for MTurk, for example in a test
+class FakeMTurk:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def list_hits(self, MaxResults=100, NextToken=None):
+        start = int(NextToken or 0)
+        page = {'HITs': self.hits[start:start + MaxResults]}
+        if start + MaxResults < len(self.hits):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+fake = MTurkClient(client=FakeMTurk([{'HITId': str(i)} for i in range(250)]))
+assert len(list(fake.paginate('list_hits', 'HITs'))) == 250
+"""
@@ -0,0 +1,282 @@
+import os
+import ast
+import json
+import zlib
+import hashlib
+import numpy as np
+import pandas as pd
+from ArticleIndex import word_shingles
+from AssignmentSource import ColumnarSource, open_source
+
+# Multiply-shift hashing, the high 32 bits of a * x + b modulo 2**64 are one permutation
+HASH_SHIFT = np.uint64(32)
+# Shingles hashed per chunk when signatures are computed in bulk
+CHUNK_SHINGLES = 1 << 15
+# Parameters that can change on a saved index, the others shape its signatures
+OVERRIDABLE_PARAMS = ('threshold',)
+
+
+def shingle_hashes(text):
+    # crc32 is stable across processes, unlike hash()
+    return np.array(sorted({zlib.crc32(' '.join(shingle).encode('utf-8'))
+                            for shingle in word_shingles(text)}), dtype=np.uint64)
+
+
+def submit_order(submit_time):
+    # Seconds since the epoch of a SubmitTime, None when it is missing
+    if not submit_time:
+        return None
+    return pd.Timestamp(submit_time).timestamp()
+
+
+def summaries_from_source(source):
+    # (key, summary, order) of every text of parsed assignments, keyed
+    # AssignmentId#Title and ordered by the SubmitTime of the assignment
+    source = open_source(source)
+    if isinstance(source, ColumnarSource):
+        # Only the answers are read, never the article texts
+        frame = source.frame(['AssignmentId', 'SubmitTime', 'Titles', 'Answers'])
+        for assignment_id, submit_time, titles, answers in frame.itertuples(index=False):
+            order = submit_order(submit_time)
+            for title, text_answers in list(zip(json.loads(titles), json.loads(answers)))[3:]:
+                yield f'{assignment_id}#{title}', text_answers[1]['Answer'], order
+        return
+    for data in source.records():
+        order = submit_order(data.get('SubmitTime'))
+        for qa in data['QuestionsAndAnswers'][3:]:
+            yield f"{data['AssignmentId']}#{qa['Title']}", qa['Answers'][1]['Answer'], order
+
+
+def summaries_from_dataset(dataset):
+    # (key, summary) of every Worker_summary of a PersonalSumDataset, keyed
+    # AssignmentID#ArticleId. They have no order, so they rank before every
+    # summary with a SubmitTime.
+    frame = dataset.frame
+    for assignment_id, article, summary in zip(frame['AssignmentID'], frame['ArticleId'],
+                                               frame['Worker_summary']):
+        yield f'{assignment_id}#{article}', summary
+
+
+class NearDuplicateIndex:
+    # MinHash signatures of word shingles with LSH banding. Texts whose
+    # estimated Jaccard similarity reaches threshold are reported as near
+    # duplicates, candidates come from the LSH buckets so no pair of texts
+    # is compared unless they share a band. Every text has an order, its
+    # submission time, so a copy can be told apart from the text it copies.
+    def __init__(self, threshold=0.8, num_perm=128, bands=16, min_shingles=5, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.min_shingles = min_shingles
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64) * 2 + 1
+        self.b = rng.integers(0, 1 << 63, size=num_perm, dtype=np.uint64)
+        self.keys = []
+        self.positions = {}
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.orders = np.empty(0, dtype=np.float64)
+        self.buckets = [{} for _ in range(bands)]
+
+    def params(self):
+        return {'threshold': self.threshold, 'num_perm': self.num_perm, 'bands': self.bands,
+                'min_shingles': self.min_shingles, 'seed': self.seed}
+
+    def version(self):
+        # Changes with the parameters and with every text added, in any order
+        digest = hashlib.sha1(repr(sorted(self.params().items())).encode())
+        for key in sorted(self.keys):
+            digest.update(key.encode('utf-8') + b'\x1f')
+        return digest.hexdigest()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def _signatures(self, hash_lists):
+        # One row per text, the hashes of many texts are permuted in one array operation
+        signatures = np.empty((len(hash_lists), self.num_perm), dtype=np.uint32)
+        start = 0
+        while start < len(hash_lists):
+            end, size = start, 0
+            while end < len(hash_lists) and (end == start or size < CHUNK_SHINGLES):
+                size += len(hash_lists[end])
+                end += 1
+            chunk = hash_lists[start:end]
+            hashes = np.concatenate(chunk)
+            permuted = ((np.outer(hashes, self.a) + self.b) >> HASH_SHIFT).astype(np.uint32)
+            offsets = np.cumsum([0] + [len(h) for h in chunk[:-1]])
+            signatures[start:end] = np.minimum.reduceat(permuted, offsets, axis=0)
+            start = end
+        return signatures
+
+    def signatures_of(self, texts):
+        # None for texts with fewer than min_shingles shingles, they are never matched
+        hash_lists = [shingle_hashes(text or '') for text in texts]
+        usable = [i for i, hashes in enumerate(hash_lists)
+                  if len(hashes) >= max(self.min_shingles, 1)]
+        signatures = [None] * len(texts)
+        if usable:
+            for i, signature in zip(usable, self._signatures([hash_lists[i] for i in usable])):
+                signatures[i] = signature
+        return signatures
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                for band in range(self.bands)]
+
+    def add_many(self, items):
+        # items are (key, text) or (key, text, order), keys already in the index
+        # are skipped. Texts without an order rank first, ties go by insertion.
+        unique = {}
+        for key, text, *order in items:
+            unique[key] = (text, order[0] if order and order[0] is not None else 0.0)
+        items = [(key, text, order) for key, (text, order) in unique.items()
+                 if key not in self.positions]
+        signatures = self.signatures_of([text for _, text, _ in items])
+        added = [(key, order, signature) for (key, _, order), signature in zip(items, signatures)
+                 if signature is not None]
+        if not added:
+            return 0
+        start = len(self.keys)
+        self.signatures = np.vstack([self.signatures, [signature for _, _, signature in added]])
+        self.orders = np.concatenate([self.orders, [order for _, order, _ in added]])
+        for position, (key, _, signature) in enumerate(added, start=start):
+            self.keys.append(key)
+            self.positions[key] = position
+            for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+                bucket.setdefault(band_key, []).append(position)
+        return len(added)
+
+    def add(self, key, text, order=None):
+        return self.add_many([(key, text, order)]) == 1
+
+    def similarity(self, signature, positions):
+        # Estimated Jaccard similarity of signature to the indexed texts at positions
+        return (self.signatures[positions] == signature).mean(axis=1)
+
+    def _candidates(self, signature):
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(band_key, ()))
+        return np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+
+    def _earlier(self, candidates, order, position):
+        # Candidates that rank before (order, position)
+        orders = self.orders[candidates]
+        return candidates[(orders < order) | ((orders == order) & (candidates < position))]
+
+    def query(self, text, exclude=None, before=None):
+        # Keys of the indexed texts similar to text, with their estimated similarity.
+        # exclude is a function on keys, for example to skip the assignment itself.
+        # With before, an order, only texts submitted before it are returned.
+        signature = self.signatures_of([text])[0]
+        if signature is None:
+            return []
+        return self._matches(signature, exclude, before, len(self.keys))
+
+    def earlier_matches(self, key, exclude=None):
+        # Indexed texts similar to the one of key that were submitted before it,
+        # the text of key is not needed since its signature is stored
+        position = self.positions[key]
+        return self._matches(self.signatures[position], exclude,
+                             self.orders[position], position)
+
+    def _matches(self, signature, exclude, before, position):
+        candidates = self._candidates(signature)
+        if before is not None:
+            candidates = self._earlier(candidates, before, position)
+        if not len(candidates):
+            return []
+        similarities = self.similarity(signature, candidates)
+        matches = [(self.keys[position], float(similarity))
+                   for position, similarity in zip(candidates, similarities)
+                   if similarity >= self.threshold]
+        if exclude is not None:
+            matches = [match for match in matches if not exclude(match[0])]
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def clusters(self):
+        # Groups of near-duplicate texts, every group has at least two keys
+        parent = np.arange(len(self.keys))
+
+        def find(position):
+            while parent[position] != position:
+                parent[position] = parent[parent[position]]
+                position = parent[position]
+            return position
+
+        for bucket in self.buckets:
+            for members in bucket.values():
+                remaining = np.asarray(members)
+                # Members similar to a pivot join its group, the rest pick the next pivot
+                while len(remaining) > 1:
+                    pivot, others = remaining[0], remaining[1:]
+                    similar = self.similarity(self.signatures[pivot], others) >= self.threshold
+                    for position in others[similar]:
+                        root_a, root_b = find(pivot), find(position)
+                        if root_a != root_b:
+                            parent[root_b] = root_a
+                    remaining = others[~similar]
+
+        groups = {}
+        for position in range(len(self.keys)):
+            groups.setdefault(find(position), []).append(self.keys[position])
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1),
+                      key=lambda group: (-len(group), group[0]))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.savez(file, keys=np.array(self.keys, dtype=str), signatures=self.signatures,
+                     orders=self.orders, params=np.array([repr(self.params())]))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **params):
+        # Returns an empty index with params when the file does not exist yet.
+        # threshold can be changed on a saved index, other params must match it.
+        if not os.path.exists(path):
+            return cls(**params)
+        with np.load(path) as data:
+            stored = ast.literal_eval(str(data['params'][0]))
+            keys = data['keys'].tolist()
+            signatures = data['signatures']
+            # Files saved before orders were kept rank their texts by insertion
+            orders = data['orders'] if 'orders' in data else np.zeros(len(keys))
+        conflicting = sorted(name for name, value in params.items()
+                             if name not in OVERRIDABLE_PARAMS and stored.get(name) != value)
+        if conflicting:
+            raise ValueError(f'{path} was built with other parameters: ' + ', '.join(
+                f'{name}={stored.get(name)!r}, not {params[name]!r}' for name in conflicting))
+        index = cls(**{**stored, **{name: value for name, value in params.items()
+                                    if name in OVERRIDABLE_PARAMS}})
+        index.keys = keys
+        index.positions = {key: position for position, key in enumerate(keys)}
+        index.signatures = signatures
+        index.orders = orders.astype(np.float64)
+        for position, signature in enumerate(signatures):
+            for bucket, band_key in zip(index.buckets, index._band_keys(signature)):
+                bucket.setdefault(band_key, []).append(position)
+        return index
+
+
+# Usage
+
+if __name__ == '__main__':
+
+    from PersonalSumDataset import PersonalSumDataset
+
+    dataset = PersonalSumDataset('dataset/Topic_centric_PersonalSum.csv')
+    index = NearDuplicateIndex(threshold=0.7)
+    index.add_many(summaries_from_dataset(dataset))
+    for cluster in index.clusters():
+        print(cluster)
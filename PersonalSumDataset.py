@@ -0,0 +1,181 @@
+import os
+import ast
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from AssignmentSource import durations_to_minutes
+from ArticleStore import article_id
+
+# Bump whenever the parsed columns change, older cache files are then rebuilt
+CACHE_VERSION = 'PersonalSumDataset-2'
+
+TEXT_COLUMNS = ['AssignmentID', 'Duration', 'Generated_summary', 'Generated_source',
+                'Worker_summary', 'Worker_source']
+# Columns that repeat on every worker row of an article, stored as categoricals
+CATEGORY_COLUMNS = ['Article', 'Category']
+
+
+def parse_qa_lists(question_answers):
+    # Every article repeats its QA list, so each distinct string is parsed once
+    parsed = {text: ast.literal_eval(text) for text in pd.unique(question_answers)}
+    return [parsed[text] for text in question_answers]
+
+
+def read_dataset_csv(csv_path):
+    # Parses the CSV into typed columns, Question_answer is parsed here and only here
+    df = pd.read_csv(csv_path, index_col=0)
+    df.index.name = None
+    df['worker_id'] = df['worker_id'].astype('int64')
+    df[TEXT_COLUMNS] = df[TEXT_COLUMNS].astype('string')
+    # Categories are written with a leading space in the CSV
+    df['Category'] = df['Category'].str.strip()
+    df[CATEGORY_COLUMNS] = df[CATEGORY_COLUMNS].astype('category')
+    # Content hash of each article, the same id the ArticleStore uses
+    article_ids = np.array([article_id(text) for text in df['Article'].cat.categories],
+                           dtype=object)
+    df['ArticleId'] = pd.Series(article_ids[df['Article'].cat.codes], index=df.index,
+                                dtype='string')
+    df['DurationMinutes'] = durations_to_minutes(df['Duration']).to_numpy()
+    df['Question_answer'] = parse_qa_lists(df['Question_answer'])
+    return df
+
+
+def _source_key(csv_path):
+    stat = os.stat(csv_path)
+    return {'version': CACHE_VERSION, 'mtime_ns': str(stat.st_mtime_ns),
+            'size': str(stat.st_size)}
+
+
+def _read_cache(cache_path, source_key):
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    cached_key = {key: metadata.get(f'personalsum.{key}'.encode(), b'').decode()
+                  for key in source_key}
+    if cached_key != source_key:
+        return None
+    table = pq.read_table(cache_path)
+    df = table.to_pandas()
+    # Parquet hands back numpy arrays, the QA lists are rebuilt as Python lists
+    df['Question_answer'] = table.column('Question_answer').to_pylist()
+    return df
+
+
+def _write_table(df, path, extra_metadata=None):
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata.update({f'personalsum.{key}'.encode(): value.encode()
+                     for key, value in (extra_metadata or {}).items()})
+    # Written next to the final path first so readers never see a partial file
+    tmp_path = path + '.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_cache(df, cache_path, source_key):
+    _write_table(df, cache_path, source_key)
+
+
+def read_export(path, article_store=None):
+    # Reads a file written by PersonalSumDataset.export, with article_store
+    # the Article column is filled in again from the ArticleIds
+    table = pq.read_table(path)
+    df = table.to_pandas()
+    df['Question_answer'] = table.column('Question_answer').to_pylist()
+    if article_store is not None:
+        texts = article_store.get_many(pd.unique(df['ArticleId']).tolist())
+        df['Article'] = df['Article'].fillna(df['ArticleId'].map(texts))
+    df['Article'] = df['Article'].astype('category')
+    return df
+
+
+class PersonalSumDataset:
+    # A PersonalSum CSV loaded into typed columns. The parsed table is cached
+    # in a Parquet file next to the CSV and reused until the CSV's size or
+    # modification time changes. Lookups by worker, assignment, category or
+    # article go through indexes built once instead of scanning the table.
+    def __init__(self, csv_path, cache_path=None, use_cache=True):
+        self.csv_path = csv_path
+        self.cache_path = cache_path or os.path.splitext(csv_path)[0] + '.parquet'
+        self.frame = self._load(use_cache)
+        self._indexes = {}
+
+    def _load(self, use_cache):
+        if not use_cache:
+            return read_dataset_csv(self.csv_path)
+        source_key = _source_key(self.csv_path)
+        df = _read_cache(self.cache_path, source_key)
+        if df is None:
+            df = read_dataset_csv(self.csv_path)
+            _write_cache(df, self.cache_path, source_key)
+        return df
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def articles(self):
+        # Each distinct article once, in ArticleId order
+        return self.frame['Article'].cat.categories
+
+    def article_id(self, article):
+        return article_id(article)
+
+    def index(self, column):
+        # Maps every value of column to the positions of its rows
+        if column not in self._indexes:
+            groups = self.frame.groupby(column, sort=False, observed=True).indices
+            self._indexes[column] = {key: np.asarray(positions)
+                                     for key, positions in groups.items()}
+        return self._indexes[column]
+
+    def rows(self, column, value):
+        positions = self.index(column).get(value, np.empty(0, dtype=np.intp))
+        return self.frame.iloc[positions]
+
+    def by_worker(self, worker_id):
+        return self.rows('worker_id', worker_id)
+
+    def by_assignment(self, assignment_id):
+        return self.rows('AssignmentID', assignment_id)
+
+    def by_category(self, category):
+        return self.rows('Category', category.strip())
+
+    def by_article(self, article):
+        # article is an ArticleId or the article text
+        if article not in self.index('ArticleId'):
+            article = self.article_id(article)
+        return self.rows('ArticleId', article)
+
+    def qa_pairs(self, position):
+        return self.frame['Question_answer'].iat[position]
+
+    def export(self, path, article_store):
+        # Writes the rows with every article replaced by its ArticleId, the
+        # texts go to article_store once. read_export loads the file again.
+        texts = self.articles.tolist()
+        stored = article_store.get_many(article_store.put_many(texts))
+        # An article the store holds in another variant stays in the file
+        kept = pd.Series([None if stored.get(article_id(text)) == text else text
+                          for text in texts], dtype='string')
+        df = self.frame.assign(Article=kept.to_numpy()[self.frame['Article'].cat.codes])
+        _write_table(df, path)
+
+
+def load_datasets(*csv_paths, **kwargs):
+    # One dataset per CSV, keyed by file name without extension
+    return {os.path.splitext(os.path.basename(path))[0]: PersonalSumDataset(path, **kwargs)
+            for path in csv_paths}
+
+
+# Usage
+
+if __name__ == '__main__':
+
+    dataset = PersonalSumDataset('dataset/Topic_centric_PersonalSum.csv')
+    print(len(dataset), 'rows,', len(dataset.articles), 'articles')
+    print(dataset.by_category('Fotball')[['worker_id', 'AssignmentID', 'DurationMinutes']])
+    print(dataset.qa_pairs(0)[0])
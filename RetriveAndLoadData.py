@@ -1,58 +1,85 @@
-﻿import pandas as pd
-import ast
-import re
-import random
+﻿import os
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from text_helpers import remove_emojis_batch
+from PersonalSumDataset import parse_qa_lists
 
 
-csv_data = "FILL INN THE PATH TO THE CSV FILE"
-storage = "FILL INN THE PATH TO THE STORAGE FOLDER"
-df = pd.read_csv(csv_data)
+def draw_distractors(articles, num_distractors=2, rng=None):
+    # Returns a (rows, num_distractors) array of row positions from other articles
+    rng = rng if rng is not None else np.random.default_rng()
+    article_codes, uniques = pd.factorize(articles)
+    if len(uniques) < 2:
+        raise ValueError("At least two different articles are needed to draw distractors")
 
-# Function to remove emojis from text
+    num_rows = len(article_codes)
+    draws = rng.integers(0, num_rows, size=(num_rows, num_distractors))
+    same_article = article_codes[draws] == article_codes[:, None]
+    while same_article.any():
+        # Only redraw the picks that landed on the row's own article
+        draws[same_article] = rng.integers(0, num_rows, size=same_article.sum())
+        same_article = article_codes[draws] == article_codes[:, None]
+    return draws
 
 
-def remove_emojis(text):
-    emoji_pattern = re.compile("["
-                               u"\U0001F600-\U0001F64F"  # emoticons
-                               u"\U0001F300-\U0001F5FF"  # symbols & pictographs
-                               u"\U0001F680-\U0001F6FF"  # transport & map symbols
-                               u"\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                               u"\U00002702-\U000027B0"
-                               u"\U000024C2-\U0001F251"
-                               "]+", flags=re.UNICODE)
-    return emoji_pattern.sub(r'', text)
+def format_article(article_text, true_qa, false_qas):
+    # Prepare the content for the text file
+    content = f"Body:\n{article_text}\n\n"
+    content += f"True QA:\nQuestion: {true_qa[0]}\n\nAnswer: {true_qa[1]}\n\n"
+    for false_qa in false_qas:
+        content += f"False QA:\nQuestion: {false_qa[0]}\n\nAnswer: {false_qa[1]}\n\n"
+    return content
 
 
-# Process each article
-for index, row in df.iterrows():
-    # Remove emojis from the article
-    article_text = remove_emojis(row['Article'])
+def build_articles(df, num_distractors=2, seed=None):
+    rng = np.random.default_rng(seed)
+    qa_lists = df['Question_answer'].tolist()
+    if qa_lists and isinstance(qa_lists[0], str):
+        qa_lists = parse_qa_lists(df['Question_answer'])
+    qa_counts = np.array([len(qa_list) for qa_list in qa_lists])
 
-    # Evaluate the string representation of the list to a list
-    qa_list = ast.literal_eval(row['Question_answer'])
+    # Select a true QA pair from the current article and false ones from other articles
+    true_picks = (rng.random(len(qa_lists)) * qa_counts).astype(int)
+    distractors = draw_distractors(df['Article'].to_numpy(), num_distractors, rng)
+    false_picks = (rng.random(distractors.shape) * qa_counts[distractors]).astype(int)
 
-    # Select a true QA pair from the current article
-    true_qa = random.choice(qa_list)
+    # Remove emojis from every distinct article in one batch
+    unique_articles = pd.unique(df['Article'])
+    article_texts = dict(zip(unique_articles, remove_emojis_batch(unique_articles)))
+    for position, (index, article) in enumerate(zip(df.index, df['Article'])):
+        true_qa = qa_lists[position][true_picks[position]]
+        false_qas = [qa_lists[row][pick]
+                     for row, pick in zip(distractors[position], false_picks[position])]
+        # Use the row index as the filename
+        yield f"{index}.txt", format_article(article_texts[article], true_qa, false_qas)
 
-    # Select false QA pairs from other articles
-    false_qas = []
-    while len(false_qas) < 2:
-        random_row = df.sample(n=1).iloc[0]
-        if random_row['Article'] != row['Article']:  # Ensure it's from a different article
-            random_qa_list = ast.literal_eval(random_row['Question_answer'])
-            false_qas.append(random.choice(random_qa_list))
 
-    # Use the row index as the filename
-    filename = f"{index}.txt"
+def _write_file(path, content):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
 
-    # Prepare the content for the text file
-    content = f"Body:\n{article_text}\n\n"
-    content += f"True QA:\nQuestion: {true_qa[0]}\n\nAnswer: {true_qa[1]}\n\n"
-    for false_qa in false_qas:
-        content += f"False QA:\nQuestion: {false_qa[0]}\n\nAnswer: {false_qa[1]}\n\n"
 
-    # Write the content to a text file
-    with open(f'{storage}/{filename}', 'w', encoding='utf-8') as file:
-        file.write(content)
+def convert_dataset(csv_data, storage, seed=None, max_workers=8):
+    # Only Article and Question_answer are read, so no cache is written next to the CSV
+    df = pd.read_csv(csv_data)
+    os.makedirs(storage, exist_ok=True)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_write_file, os.path.join(storage, filename), content)
+                   for filename, content in build_articles(df, seed=seed)]
+        for future in futures:
+            future.result()
+
+    print("Files have been created successfully.")
+    return len(futures)
+
+
+# Usage
+
+if __name__ == '__main__':
 
-print("Files have been created successfully.")
+    csv_data = "FILL INN THE PATH TO THE CSV FILE"
+    storage = "FILL INN THE PATH TO THE STORAGE FOLDER"
+    # Set a seed to get the same QA pairs on every run
+    convert_dataset(csv_data, storage, seed=None)
@@ -0,0 +1,252 @@
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from ArticleIndex import WORD_PATTERN, get_article_index
+from text_helpers import normalize_text
+
+# Compared pairs of dataset columns, the worker's text is scored against the generated one
+PAIRS = {
+    'Summary': ('Worker_summary', 'Generated_summary'),
+    'Source': ('Worker_source', 'Generated_source'),
+}
+# Generated_source lists the selected sentences separated by '|'
+SOURCE_SEPARATOR = '|'
+GROUP_COLUMNS = ('Category', 'worker_id')
+
+
+def tokenize(text):
+    return WORD_PATTERN.findall(text.casefold()) if isinstance(text, str) else []
+
+
+def lcs_length(a, b):
+    # Bit-parallel LCS (Hyyro): one big-integer step per token of b
+    if not a or not b:
+        return 0
+    masks = {}
+    for position, token in enumerate(a):
+        masks[token] = masks.get(token, 0) | (1 << position)
+    full = (1 << len(a)) - 1
+    v = full
+    for token in b:
+        u = v & masks.get(token, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - v.bit_count()
+
+
+def _lcs_lengths(pairs):
+    return [lcs_length(a, b) for a, b in pairs]
+
+
+def _map_chunks(function, items, max_workers=1):
+    # function takes a list of items, chunks of items run on a process pool
+    # only when more than one worker is asked for
+    if not max_workers or max_workers <= 1 or len(items) < 2:
+        return function(items)
+    chunk = max(1, len(items) // (max_workers * 4))
+    chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [result for results in executor.map(function, chunks) for result in results]
+
+
+class TokenizedTexts:
+    # Every distinct text is tokenized once, tokens are integer ids of one vocabulary
+    def __init__(self, texts):
+        self.codes, uniques = pd.factorize(pd.Series(texts, dtype=object), use_na_sentinel=False)
+        tokens = [tokenize(text) for text in uniques]
+        lengths = np.array([len(text_tokens) for text_tokens in tokens])
+        ids, self.vocabulary = pd.factorize(
+            pd.Series([token for text_tokens in tokens for token in text_tokens], dtype=object))
+        self.tokens = np.split(ids.astype(np.int64), np.cumsum(lengths)[:-1])
+
+    def grams(self, n):
+        # n-gram ids of every distinct text, factorized so they stay small
+        if n == 1:
+            return self.tokens
+        size = len(self.vocabulary)
+        grams = [tokens[:-1] * size + tokens[1:] if len(tokens) > 1
+                 else np.empty(0, dtype=np.int64) for tokens in self.tokens]
+        lengths = np.array([len(text_grams) for text_grams in grams])
+        ids, _ = pd.factorize(np.concatenate(grams) if grams else np.empty(0, dtype=np.int64))
+        return np.split(ids.astype(np.int64), np.cumsum(lengths)[:-1])
+
+
+def _row_gram_counts(grams, codes, width):
+    # Unique (row, gram) keys with their counts, and the number of grams per row
+    row_grams = [grams[code] for code in codes]
+    lengths = np.array([len(text_grams) for text_grams in row_grams], dtype=np.int64)
+    rows = np.repeat(np.arange(len(codes), dtype=np.int64), lengths)
+    grams = np.concatenate(row_grams) if row_grams else np.empty(0, dtype=np.int64)
+    keys, counts = np.unique(rows * width + grams, return_counts=True)
+    return keys, counts, lengths
+
+
+def _overlap(grams, candidate_codes, reference_codes):
+    # Clipped n-gram matches and distinct shared n-grams per row, in one pass over all rows
+    width = max((int(text_grams.max()) for text_grams in grams if len(text_grams)),
+                default=0) + 1
+    rows = len(candidate_codes)
+    c_keys, c_counts, c_lengths = _row_gram_counts(grams, candidate_codes, width)
+    r_keys, r_counts, r_lengths = _row_gram_counts(grams, reference_codes, width)
+    _, c_index, r_index = np.intersect1d(c_keys, r_keys, assume_unique=True,
+                                         return_indices=True)
+    shared_rows = c_keys[c_index] // width
+    matches = np.bincount(shared_rows, minlength=rows,
+                          weights=np.minimum(c_counts[c_index], r_counts[r_index]))
+    shared = np.bincount(shared_rows, minlength=rows)
+    c_distinct = np.bincount(c_keys // width, minlength=rows)
+    r_distinct = np.bincount(r_keys // width, minlength=rows)
+    return matches, shared, c_distinct, r_distinct, c_lengths, r_lengths
+
+
+def _ratio(numerator, denominator):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator),
+                     where=denominator > 0)
+
+
+def _scores(prefix, matches, candidate_lengths, reference_lengths):
+    precision = _ratio(matches, candidate_lengths)
+    recall = _ratio(matches, reference_lengths)
+    return {f'{prefix}_P': precision, f'{prefix}_R': recall,
+            f'{prefix}_F': _ratio(2 * precision * recall, precision + recall)}
+
+
+def evaluate_pairs(candidates, references, max_workers=1):
+    # ROUGE-1/2/L and token overlap of every candidate against its reference.
+    # ROUGE-L runs on a process pool when max_workers is above 1.
+    candidates, references = list(candidates), list(references)
+    texts = TokenizedTexts(candidates + references)
+    # Both sides index the same distinct texts
+    candidate_codes = texts.codes[:len(candidates)]
+    reference_codes = texts.codes[len(candidates):]
+
+    scores = {}
+    for n in (1, 2):
+        matches, shared, c_distinct, r_distinct, c_lengths, r_lengths = _overlap(
+            texts.grams(n), candidate_codes, reference_codes)
+        scores.update(_scores(f'ROUGE{n}', matches, c_lengths, r_lengths))
+        if n == 1:
+            scores['TokenOverlap'] = _ratio(shared, c_distinct + r_distinct - shared)
+            candidate_lengths, reference_lengths = c_lengths, r_lengths
+
+    # LCS is computed once per distinct pair of texts
+    pair_codes = pd.MultiIndex.from_arrays([candidate_codes, reference_codes])
+    pair_index, distinct_pairs = pd.factorize(pair_codes)
+    pairs = [(texts.tokens[r].tolist(), texts.tokens[c].tolist()) for c, r in distinct_pairs]
+    lcs = np.array(_map_chunks(_lcs_lengths, pairs, max_workers), dtype=float)[pair_index]
+    scores.update(_scores('ROUGEL', lcs, candidate_lengths, reference_lengths))
+    return pd.DataFrame(scores)
+
+
+def _source_sentences(generated_source):
+    sentences = [normalize_text(sentence)
+                 for sentence in generated_source.split(SOURCE_SEPARATOR)]
+    return [sentence for sentence in sentences if sentence]
+
+
+def source_coverage(worker_source, generated_source, sentences=None):
+    # Share of the generated source sentences that the worker's source contains
+    if not isinstance(worker_source, str) or not isinstance(generated_source, str):
+        return 0.0
+    if sentences is None:
+        sentences = _source_sentences(generated_source)
+    if not sentences:
+        return 0.0
+    worker_source = normalize_text(worker_source)
+    return sum(1 for sentence in sentences if sentence in worker_source) / len(sentences)
+
+
+def _source_in_article(worker_source, article):
+    if not isinstance(worker_source, str) or not isinstance(article, str):
+        return 0.0
+    return get_article_index(article).fragment_ratio(worker_source)
+
+
+def _source_scores(groups):
+    # groups hold an article with its (worker source, generated source) rows,
+    # returns (coverage, share in article) per row
+    results = []
+    for article, rows in groups:
+        # The generated source repeats for every worker of an article
+        sentences = {}
+        scores = []
+        for worker_source, generated_source in rows:
+            if isinstance(generated_source, str) and generated_source not in sentences:
+                sentences[generated_source] = _source_sentences(generated_source)
+            scores.append((
+                source_coverage(worker_source, generated_source,
+                                sentences.get(generated_source)),
+                _source_in_article(worker_source, article)))
+        results.append(scores)
+    return results
+
+
+class SummaryEvaluation:
+    # Scores every row of a PersonalSum dataset: ROUGE-1/2/L precision, recall
+    # and F1 plus token overlap for the summary and source pairs, the share of
+    # the generated source covered by the worker's source and the share of
+    # the worker's source found in the article.
+    def __init__(self, dataset, max_workers=1):
+        # dataset is a PersonalSumDataset or its frame, max_workers above 1
+        # spreads ROUGE-L and the source scores over processes
+        self.frame = getattr(dataset, 'frame', dataset)
+        self.max_workers = max_workers
+        self.scores = self._evaluate()
+
+    def _evaluate(self):
+        frame = self.frame
+        columns = [frame[[column for column in GROUP_COLUMNS if column in frame]]
+                   .reset_index(drop=True)]
+        for name, (candidate, reference) in PAIRS.items():
+            scores = evaluate_pairs(frame[candidate].tolist(), frame[reference].tolist(),
+                                    self.max_workers)
+            columns.append(scores.add_prefix(f'{name}_'))
+        # Rows are grouped by article, so each article is sent to a worker and indexed once
+        codes, articles = pd.factorize(frame['Article'].astype(object))
+        order = np.argsort(codes, kind='stable')
+        positions = [group for group in np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+                     if len(group)]
+        worker_sources = frame['Worker_source'].astype(object).to_numpy()
+        generated_sources = frame['Generated_source'].astype(object).to_numpy()
+        groups = [(articles[codes[group[0]]],
+                   list(zip(worker_sources[group], generated_sources[group])))
+                  for group in positions]
+        source_scores = np.zeros((len(frame), 2))
+        for group, scores in zip(positions, _map_chunks(_source_scores, groups,
+                                                        self.max_workers)):
+            source_scores[group] = scores
+        columns.append(pd.DataFrame(source_scores, columns=['SourceCoverage', 'SourceInArticle']))
+        scores = pd.concat(columns, axis=1)
+        scores.index = frame.index
+        return scores
+
+    def metrics(self):
+        return [column for column in self.scores.columns if column not in GROUP_COLUMNS]
+
+    def aggregate(self, by):
+        # Mean of every metric per group, with the number of rows
+        grouped = self.scores.groupby(list(by) if isinstance(by, (list, tuple)) else by,
+                                      observed=True)
+        table = grouped[self.metrics()].mean()
+        table.insert(0, 'Rows', grouped.size())
+        return table
+
+    def by_category(self):
+        return self.aggregate('Category')
+
+    def by_worker(self):
+        return self.aggregate('worker_id')
+
+
+# Usage
+
+if __name__ == '__main__':
+
+    from PersonalSumDataset import PersonalSumDataset
+
+    dataset = PersonalSumDataset('dataset/Topic_centric_PersonalSum.csv')
+    evaluation = SummaryEvaluation(dataset)
+    print(evaluation.by_category()[['Rows', 'Summary_ROUGE1_F', 'Summary_ROUGE2_F',
+                                    'Summary_ROUGEL_F', 'SourceCoverage']])
+    print(evaluation.by_worker().sort_values('Summary_ROUGEL_F').head(10))
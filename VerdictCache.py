@@ -0,0 +1,57 @@
+import os
+import json
+
+
+class VerdictCache:
+    def __init__(self, cache_path, version):
+        self.cache_path = cache_path
+        self.version = version
+        self.entries = {}
+        self.changed = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        # A different rule set invalidates every cached verdict
+        if data.get('version') == self.version:
+            self.entries = data.get('entries', {})
+        else:
+            self.changed = True
+
+    @staticmethod
+    def file_key(stat):
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def get(self, path, key):
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is not None and entry['key'] == key:
+            return entry['verdict']
+        return None
+
+    def put(self, path, key, verdict):
+        self.entries[os.path.abspath(path)] = {'key': key, 'verdict': verdict}
+        self.changed = True
+
+    def prune(self, paths):
+        # Drop verdicts of files that no longer exist
+        keep = {os.path.abspath(path) for path in paths}
+        stale = [path for path in self.entries if path not in keep]
+        for path in stale:
+            del self.entries[path]
+        self.changed = self.changed or bool(stale)
+
+    def save(self):
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'version': self.version, 'entries': self.entries}, file)
+        os.replace(tmp_path, self.cache_path)
+        self.changed = False
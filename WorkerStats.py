@@ -0,0 +1,121 @@
+import pandas as pd
+from AssignmentSource import open_source, durations_to_minutes
+
+STATS_COLUMNS = ['WorkerId', 'Duration']
+
+
+def min_short_assignments(min_jobs=10):
+    # Workers with at least min_jobs assignments at or below the short duration
+    return lambda stats: stats['ShortAssignments'] >= min_jobs
+
+
+def min_rejection_rate(rate, min_evaluated=5):
+    # Workers with enough evaluated assignments and a rejection rate of at least rate
+    return lambda stats: ((stats['Evaluated'] >= min_evaluated)
+                          & (stats['RejectionRate'] >= rate))
+
+
+def min_rule_failures(rule, min_failures):
+    # Workers with at least min_failures assignments that failed the rule
+    def policy(stats):
+        column = f'Failed_{rule}'
+        if column not in stats:
+            return pd.Series(False, index=stats.index)
+        return stats[column] >= min_failures
+    return policy
+
+
+def any_of(*policies):
+    def policy(stats):
+        selected = pd.Series(False, index=stats.index)
+        for other in policies:
+            selected |= other(stats)
+        return selected
+    return policy
+
+
+def all_of(*policies):
+    def policy(stats):
+        selected = pd.Series(True, index=stats.index)
+        for other in policies:
+            selected &= other(stats)
+        return selected
+    return policy
+
+
+# The original rule of BanFilter: ten or more assignments of at most five minutes
+DEFAULT_BAN_POLICY = min_short_assignments(10)
+
+
+class WorkerStats:
+    # Per-worker statistics over all assignments, computed in one vectorized pass.
+    # A ban policy is any function from the stats table to a boolean Series.
+    def __init__(self, assignments, verdicts=None, short_duration=5,
+                 percentiles=(0.1, 0.5, 0.9)):
+        self.short_duration = short_duration
+        self.percentiles = percentiles
+        self.table = self._compute(pd.DataFrame(assignments, columns=STATS_COLUMNS),
+                                   verdicts or [])
+
+    @classmethod
+    def from_source(cls, source, verdicts=None, **kwargs):
+        # source is a folder of JSON files, a Parquet/Arrow file or a source object
+        return cls(open_source(source).frame(STATS_COLUMNS), verdicts, **kwargs)
+
+    def _compute(self, assignments, verdicts):
+        minutes = durations_to_minutes(assignments['Duration']).to_numpy()
+        assignments = assignments.assign(Minutes=minutes,
+                                         Short=minutes <= self.short_duration)
+        by_worker = assignments.groupby('WorkerId', sort=False)
+        table = pd.DataFrame({
+            'Assignments': by_worker.size(),
+            'ShortAssignments': by_worker['Short'].sum(),
+        })
+        quantiles = by_worker['Minutes'].quantile(list(self.percentiles)).unstack()
+        quantiles.columns = [f'MinutesP{round(q * 100)}' for q in quantiles.columns]
+        table = table.join(quantiles)
+
+        verdicts = pd.DataFrame({
+            'WorkerId': [verdict.get('WorkerId') for verdict in verdicts],
+            'Rejected': [bool(verdict['Rejected']) for verdict in verdicts],
+            'Rules': [list(verdict['Failed']) for verdict in verdicts],
+        })
+        by_verdict = verdicts.groupby('WorkerId', sort=False)['Rejected']
+        table = table.join(pd.DataFrame({'Evaluated': by_verdict.size(),
+                                         'Rejected': by_verdict.sum()}), how='outer')
+
+        # Number of assignments per worker that failed each rule
+        failures = verdicts.explode('Rules', ignore_index=True).dropna(subset=['Rules'])
+        if len(failures):
+            histogram = pd.crosstab(failures['WorkerId'], failures['Rules'])
+            histogram.columns = [f'Failed_{rule}' for rule in histogram.columns]
+            table = table.join(histogram, how='outer')
+
+        counts = [column for column in table.columns if not column.startswith('MinutesP')]
+        table[counts] = table[counts].fillna(0).astype(int)
+        evaluated = table['Evaluated'].where(table['Evaluated'] > 0)
+        table['RejectionRate'] = (table['Rejected'] / evaluated).fillna(0.0)
+        table.index.name = 'WorkerId'
+        return table
+
+    def failure_histogram(self):
+        return self.table[[column for column in self.table.columns
+                           if column.startswith('Failed_')]]
+
+    def select(self, policy=DEFAULT_BAN_POLICY):
+        return self.table[policy(self.table).to_numpy()]
+
+    def ban(self, policy=DEFAULT_BAN_POLICY):
+        return self.select(policy).index.tolist()
+
+
+# Usage
+
+if __name__ == '__main__':
+
+    folder_path = '../ParsedNotFilteredHITS'
+    stats = WorkerStats.from_source(folder_path)
+    print(stats.table.sort_values('ShortAssignments', ascending=False).head(20))
+
+    for worker in stats.ban(any_of(DEFAULT_BAN_POLICY, min_rejection_rate(0.8))):
+        print(worker)
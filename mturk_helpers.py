@@ -1,31 +1,23 @@
 import boto3
 import os
-import xmltodict
+import io
 import chardet
-import re
 import xml.etree.ElementTree as ET
 import json
 import datetime
+import functools
+import collections
 import concurrent.futures
 import threading
 import pandas as pd
 from datetime import timezone, timedelta
 import pytz  # For timezone operations
-
-
-def remove_emojis(text):
-    emoji_pattern = re.compile(
-        "["
-        "\U0001F600-\U0001F64F"  # emoticons
-        "\U0001F300-\U0001F5FF"  # symbols & pictographs
-        "\U0001F680-\U0001F6FF"  # transport & map symbols
-        "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-        "\U00002702-\U000027B0"
-        "\U000024C2-\U0001F251"
-        "]+",
-        flags=re.UNICODE,
-    )
-    return emoji_pattern.sub(r"", text)
+from botocore.exceptions import ClientError
+from MTurkClient import MTurkClient, wrap_client
+from HITCache import HITCache, question_hash
+from ArticleStore import article_id, overview_texts
+from AnswerKey import write_answer_key
+from text_helpers import remove_emojis
 
 
 def extract_body_from_text(file_path):
@@ -77,102 +69,192 @@ def extract_qa_pairs(content):
     return qa_pairs
 
 
-def parse_question_xml(question_xml):
-    question_data = xmltodict.parse(question_xml)
-    questions = question_data["QuestionForm"]["Overview"]
-    parsed_questions = []
-    for question in questions:
-        title = question.get("Title", "No Title")
-        text = question["Text"]
-        parsed_questions.append({"Title": title, "Text": text})
-    return parsed_questions
+# Parsed question forms by question hash, every distinct HIT form is parsed once
+_question_forms = {}
+
+
+def _local_name(tag):
+    # Drops the namespace of a tag like "{http://...QuestionForm.xsd}Overview"
+    return tag.rpartition("}")[2]
+
+
+def _element_text(element):
+    # Same stripping as xmltodict, which returned None for empty elements
+    text = (element.text or "").strip()
+    return text or None
+
+
+def _parse_question_form(question_xml):
+    overviews = []
+    for _, element in ET.iterparse(
+        io.BytesIO(question_xml.encode("utf-8")), events=("end",)
+    ):
+        name = _local_name(element.tag)
+        if name == "Overview":
+            title = "No Title"
+            text = None
+            for child in element:
+                child_name = _local_name(child.tag)
+                if child_name == "Title":
+                    title = _element_text(child)
+                elif child_name == "Text":
+                    text = _element_text(child)
+            overviews.append((title, text))
+            element.clear()
+        elif name == "Question":
+            # Only the overviews are needed, the selections are dropped as we go
+            element.clear()
+    return tuple(overviews)
+
+
+def parse_question_form(question_xml, question_key=None):
+    # Returns a tuple of (title, text) pairs for the Overview elements
+    key = question_key or question_hash(question_xml)
+    overviews = _question_forms.get(key)
+    if overviews is None:
+        overviews = _question_forms[key] = _parse_question_form(question_xml)
+    return overviews
+
+
+def parse_question_xml(question_xml, question_key=None):
+    return [
+        {"Title": title, "Text": text}
+        for title, text in parse_question_form(question_xml, question_key)
+    ]
 
 
 def parse_answer_xml(answer_xml):
-    parsed_data = xmltodict.parse(answer_xml)
     parsed_answers = []
     passed = 3
 
-    if (
-        "QuestionFormAnswers" in parsed_data
-        and "Answer" in parsed_data["QuestionFormAnswers"]
+    for _, element in ET.iterparse(
+        io.BytesIO(answer_xml.encode("utf-8")), events=("end",)
     ):
-        answers = parsed_data["QuestionFormAnswers"]["Answer"]
-        if not isinstance(answers, list):
-            answers = [answers]
-
-        for answer in answers:
-            qid = answer["QuestionIdentifier"]
-            answer_text = answer.get(
-                "FreeText", answer.get("SelectionIdentifier", "No Answer Text")
-            )
-            if "incorrect" in answer_text:
-                passed -= 1
-            parsed_answers.append({"Question ID": qid, "Answer": answer_text})
+        if _local_name(element.tag) != "Answer":
+            continue
+        qid = None
+        free_text = None
+        has_free_text = False
+        selections = []
+        for child in element:
+            child_name = _local_name(child.tag)
+            if child_name == "QuestionIdentifier":
+                qid = _element_text(child)
+            elif child_name == "FreeText":
+                free_text = _element_text(child)
+                has_free_text = True
+            elif child_name == "SelectionIdentifier":
+                selections.append(_element_text(child))
+        element.clear()
+
+        if has_free_text:
+            answer_text = free_text or ""
+        elif selections:
+            answer_text = selections[0] if len(selections) == 1 else selections
+        else:
+            answer_text = "No Answer Text"
+        if "incorrect" in answer_text:
+            passed -= 1
+        parsed_answers.append({"Question ID": qid, "Answer": answer_text})
 
     return parsed_answers, passed
 
 
-def create_HIT_test_xml(files, questions_per_text=3):
-    xml_parts = ['<?xml version="1.0" encoding="UTF-8"?>']
-    xml_parts.append(
-        '<QuestionForm xmlns="http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2005-10-01/QuestionForm.xsd">'
-    )
-    xml_parts.append(
-        "<Overview><Text>Velkommen til oppgaven! Vennligst les teksten nedenfor nøye. Din oppgave er å velge det korrekte spørsmål-svar paret som tilsvarer teksten og gi en oppsummering på to til tre setninger av den delen i teksten du syntes var mest interessant. Oppsumeringen skal ikke være på jeg form, og ikke inneholde annen tekst enn bare oppsummeringen. I kilder feltet skal du kopiere inn den delen av nyhetsartikkelen du oppsumerte, har du eksempelvis oppsumert fra de første tre setningene i nyhetsartikkelen skal du kopiere inn disse. Her er det viktig at du ikke skriver inn setninger som ikke finnes i den originale teksten.</Text></Overview>"
-    )
-    xml_parts.append(
-        "<Overview><Text>Teksten din vil bli evaluert basert på nøyaktigheten av svarene dine. For å unngå avvisning, er det viktig at du svarer korrekt på kontrollspørsmålene og velger et spørsmål-svar par som nøyaktig reflekterer informasjonen i teksten. Ukorrekte eller irrelevante svar kan føre til at bidraget ditt blir avvist.</Text></Overview>"
-    )
-    xml_parts.append(
-        "<Overview><Text>Du kan kvalifisere deg for en bonus basert på kvaliteten og kvantiteten av arbeidet ditt. Høykvalitetsbidrag som viser en grundig forståelse av teksten og et presist valg av spørsmål-svar par, vil øke sjansene dine for å motta en bonus. Jo flere oppgaver du fullfører med høy kvalitet, desto større er sjansen for bonus.</Text></Overview>"
-    )
-
-    for idx, file_path in enumerate(files, start=1):
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
+def parse_article_file(file_path):
+    # Reads the file once and returns its body and QA pairs, or None
+    with open(file_path, "rb") as file:
+        raw_data = file.read()
+    try:
+        content = raw_data.decode("utf-8")
+    except UnicodeDecodeError:
+        print(f"Unicode Decode Error in file: {file_path}. Skipping file.")
+        return None
 
-        body = extract_body_from_text(file_path)
+    if "Body:" in content and "Category:" in content:
+        body = content.split("Body:")[1].split("Category:")[0].strip()
+        body = remove_emojis(body)
         if not body:
+            return None
+        return body, extract_qa_pairs(content)
+    else:
+        print(f"Markers not found in file: {file_path}")
+        return None
+
+
+HIT_INTRODUCTION = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<QuestionForm xmlns="http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/2005-10-01/QuestionForm.xsd">'
+    "<Overview><Text>Velkommen til oppgaven! Vennligst les teksten nedenfor nøye. Din oppgave er å velge det korrekte spørsmål-svar paret som tilsvarer teksten og gi en oppsummering på to til tre setninger av den delen i teksten du syntes var mest interessant. Oppsumeringen skal ikke være på jeg form, og ikke inneholde annen tekst enn bare oppsummeringen. I kilder feltet skal du kopiere inn den delen av nyhetsartikkelen du oppsumerte, har du eksempelvis oppsumert fra de første tre setningene i nyhetsartikkelen skal du kopiere inn disse. Her er det viktig at du ikke skriver inn setninger som ikke finnes i den originale teksten.</Text></Overview>"
+    "<Overview><Text>Teksten din vil bli evaluert basert på nøyaktigheten av svarene dine. For å unngå avvisning, er det viktig at du svarer korrekt på kontrollspørsmålene og velger et spørsmål-svar par som nøyaktig reflekterer informasjonen i teksten. Ukorrekte eller irrelevante svar kan føre til at bidraget ditt blir avvist.</Text></Overview>"
+    "<Overview><Text>Du kan kvalifisere deg for en bonus basert på kvaliteten og kvantiteten av arbeidet ditt. Høykvalitetsbidrag som viser en grundig forståelse av teksten og et presist valg av spørsmål-svar par, vil øke sjansene dine for å motta en bonus. Jo flere oppgaver du fullfører med høy kvalitet, desto større er sjansen for bonus.</Text></Overview>"
+)
+
+SUMMARY_QUESTION = (
+    "<QuestionContent><Text>Skriv en oppsummering på to til tre setninger av den delen i teksten du syntes var mest interessant. Oppsumeringen skal ikke være på jeg form:</Text></QuestionContent>"
+    '<AnswerSpecification><FreeTextAnswer><Constraints><Length minLength="1" /></Constraints></FreeTextAnswer></AnswerSpecification></Question>'
+)
+
+SOURCE_QUESTION = (
+    "<QuestionContent><Text>Kilde - Kopier inn den delen av nyhetsartikkelen du oppsumerte fra:</Text></QuestionContent>"
+    '<AnswerSpecification><FreeTextAnswer><Constraints><Length minLength="1" /></Constraints></FreeTextAnswer></AnswerSpecification></Question>'
+)
+
+
+def build_hit_xml(articles, questions_per_text=3):
+    # articles holds a (body, qa_pairs) tuple per text, or None for a skipped file
+    xml_parts = [HIT_INTRODUCTION]
+
+    for idx, article in enumerate(articles, start=1):
+        if article is None:
             continue
+        body, qa_pairs = article
 
-        qa_pairs = extract_qa_pairs(content)
         xml_parts.append(
             f"<Overview><Title>Tekst {idx}</Title><Text><![CDATA[{body}]]></Text></Overview>"
         )
 
-        question_element = f"<Question><QuestionIdentifier>text{idx}_questions</QuestionIdentifier><IsRequired>true</IsRequired>"
-        question_element += "<QuestionContent><Text>Velg korrekt spørsmål-svar par som tilhører teksten:</Text></QuestionContent>"
-        selections = ""
+        xml_parts.append(
+            f"<Question><QuestionIdentifier>text{idx}_questions</QuestionIdentifier><IsRequired>true</IsRequired>"
+            "<QuestionContent><Text>Velg korrekt spørsmål-svar par som tilhører teksten:</Text></QuestionContent>"
+            "<AnswerSpecification><SelectionAnswer><StyleSuggestion>radiobutton</StyleSuggestion><Selections>"
+        )
         for q_idx, (question, answer, is_correct) in enumerate(
             qa_pairs[:questions_per_text], start=1
         ):
             selection_id = f'{"correct" if is_correct else "incorrect"}_{idx}_{q_idx}'
-            selection = f"<Selection><SelectionIdentifier>{selection_id}</SelectionIdentifier><Text><![CDATA[Spørsmål {question} Svar {answer}]]></Text></Selection>"
-            selections += selection
-
-        question_element += f"<AnswerSpecification><SelectionAnswer><StyleSuggestion>radiobutton</StyleSuggestion><Selections>{selections}</Selections></SelectionAnswer></AnswerSpecification></Question>"
-        xml_parts.append(question_element)
-
-        summary_question = f"<Question><QuestionIdentifier>text{idx}_summary</QuestionIdentifier><IsRequired>true</IsRequired>"
-        summary_question += "<QuestionContent><Text>Skriv en oppsummering på to til tre setninger av den delen i teksten du syntes var mest interessant. Oppsumeringen skal ikke være på jeg form:</Text></QuestionContent>"
-        summary_question += '<AnswerSpecification><FreeTextAnswer><Constraints><Length minLength="1" /></Constraints></FreeTextAnswer></AnswerSpecification></Question>'
+            xml_parts.append(
+                f"<Selection><SelectionIdentifier>{selection_id}</SelectionIdentifier><Text><![CDATA[Spørsmål {question} Svar {answer}]]></Text></Selection>"
+            )
+        xml_parts.append(
+            "</Selections></SelectionAnswer></AnswerSpecification></Question>"
+        )
 
-        xml_parts.append(summary_question)
+        xml_parts.append(
+            f"<Question><QuestionIdentifier>text{idx}_summary</QuestionIdentifier><IsRequired>true</IsRequired>"
+        )
+        xml_parts.append(SUMMARY_QUESTION)
 
-        source_question = f"<Question><QuestionIdentifier>text{idx}_source</QuestionIdentifier><IsRequired>true</IsRequired>"
-        source_question += "<QuestionContent><Text>Kilde - Kopier inn den delen av nyhetsartikkelen du oppsumerte fra:</Text></QuestionContent>"
-        source_question += '<AnswerSpecification><FreeTextAnswer><Constraints><Length minLength="1" /></Constraints></FreeTextAnswer></AnswerSpecification></Question>'
-        xml_parts.append(source_question)
+        xml_parts.append(
+            f"<Question><QuestionIdentifier>text{idx}_source</QuestionIdentifier><IsRequired>true</IsRequired>"
+        )
+        xml_parts.append(SOURCE_QUESTION)
 
     xml_parts.append("</QuestionForm>")
     return "".join(xml_parts)
 
 
-def process_directory_in_chunks(
-    directory, output_dir, chunk_size=3, questions_per_text=3
-):
-    os.makedirs(output_dir, exist_ok=True)
+def create_HIT_test_xml(files, questions_per_text=3):
+    return build_hit_xml(
+        [parse_article_file(file_path) for file_path in files],
+        questions_per_text=questions_per_text,
+    )
+
+
+def _build_chunk_xml(chunk_files, questions_per_text):
+    return create_HIT_test_xml(chunk_files, questions_per_text=questions_per_text)
+
+
+def iter_directory_chunks(directory, chunk_size=3):
     all_filenames = [
         os.path.join(directory, f)
         for f in sorted(os.listdir(directory))
@@ -187,14 +269,85 @@ def process_directory_in_chunks(
             remaining = chunk_size - len(chunk_files)
             chunk_files.extend(all_filenames[:remaining])
 
-        hit_xml = create_HIT_test_xml(
-            chunk_files, questions_per_text=questions_per_text
-        )
+        yield i // chunk_size, chunk_files
 
-        output_file_path = os.path.join(output_dir, f"hit_{i // chunk_size}.xml")
-        with open(output_file_path, "w", encoding="utf-8") as output_file:
-            output_file.write(hit_xml)
-        print(f"Created HIT XML file: {output_file_path}")
+
+def iter_hit_xmls(directory, chunk_size=3, questions_per_text=3, max_workers=None):
+    # Yields (hit number, files, xml) in order with a bounded number of HITs in flight
+    chunks = iter_directory_chunks(directory, chunk_size)
+    if max_workers == 1:
+        for hit_number, chunk_files in chunks:
+            yield hit_number, chunk_files, _build_chunk_xml(
+                chunk_files, questions_per_text
+            )
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    in_flight = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for hit_number, chunk_files in chunks:
+            in_flight.append(
+                (
+                    hit_number,
+                    chunk_files,
+                    executor.submit(_build_chunk_xml, chunk_files, questions_per_text),
+                )
+            )
+            if len(in_flight) >= max_workers * 4:
+                hit_number, chunk_files, future = in_flight.pop(0)
+                yield hit_number, chunk_files, future.result()
+        for hit_number, chunk_files, future in in_flight:
+            yield hit_number, chunk_files, future.result()
+
+
+def process_directory_in_chunks(
+    directory,
+    output_dir,
+    chunk_size=3,
+    questions_per_text=3,
+    max_workers=None,
+    manifest_path=None,
+    write_files=True,
+    answer_keys_path=None,
+):
+    # With manifest_path every HIT is also written as one line of a JSONL manifest,
+    # write_files=False skips the individual XML files. With answer_keys_path the
+    # answer key of every HIT form is appended to a JSONL file for AnswerGrader.
+    if write_files:
+        os.makedirs(output_dir, exist_ok=True)
+    manifest = open(manifest_path, "w", encoding="utf-8") if manifest_path else None
+    answer_keys = (
+        open(answer_keys_path, "a", encoding="utf-8") if answer_keys_path else None
+    )
+    try:
+        for hit_number, chunk_files, hit_xml in iter_hit_xmls(
+            directory, chunk_size, questions_per_text, max_workers
+        ):
+            output_file_path = os.path.join(output_dir, f"hit_{hit_number}.xml")
+            if write_files:
+                with open(output_file_path, "w", encoding="utf-8") as output_file:
+                    output_file.write(hit_xml)
+                print(f"Created HIT XML file: {output_file_path}")
+            if answer_keys is not None:
+                write_answer_key(answer_keys, hit_xml)
+            if manifest is not None:
+                manifest.write(
+                    json.dumps(
+                        {
+                            "Hit": f"hit_{hit_number}",
+                            "XMLFile": output_file_path,
+                            "Files": chunk_files,
+                            "Question": hit_xml,
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if answer_keys is not None:
+            answer_keys.close()
 
 
 def create_question_xml(field_dict, free_text_fields):
@@ -245,6 +398,7 @@ def create_answer_key_xml(field_dict):
 def create_qualification_type(
     mturk_client, name, description, test, answer_key, duration
 ):
+    mturk_client = wrap_client(mturk_client)
     response = mturk_client.create_qualification_type(
         Name=name,
         Description=description,
@@ -258,6 +412,7 @@ def create_qualification_type(
 
 
 def list_my_qualifications(mturk_client):
+    mturk_client = wrap_client(mturk_client)
     my_qualifications = []
     next_token = None
     while True:
@@ -280,19 +435,28 @@ def list_my_qualifications(mturk_client):
     return my_qualifications
 
 
-def create_hit_with_xml_file(xml_file_path, mturk_client, qualification_type_id):
-    with open(xml_file_path, "r") as file:
-        question_xml = file.read()
-    response = mturk_client.create_hit(
-        Title="NorwAI Norwegian/Norsk Annotation",
-        Description="Les en nyhetsartikkel og gi et sammendrag og svar på spørsmål.",
-        Keywords="nyheter, annotering, sammendrag, lesing",
-        Reward="6.00",
-        MaxAssignments=2,
-        LifetimeInSeconds=1920000,
-        AssignmentDurationInSeconds=1800,
-        Question=question_xml,
-        QualificationRequirements=[
+HIT_TITLE = "NorwAI Norwegian/Norsk Annotation"
+HIT_DESCRIPTION = "Les en nyhetsartikkel og gi et sammendrag og svar på spørsmål."
+HIT_KEYWORDS = "nyheter, annotering, sammendrag, lesing"
+HIT_REWARD = "6.00"
+HIT_LIFETIME_SECONDS = 1920000
+HIT_ASSIGNMENT_DURATION_SECONDS = 1800
+
+
+def hit_parameters(
+    question_xml, qualification_type_id, max_assignments=2, reward=HIT_REWARD
+):
+    # The create_hit arguments shared by every HIT of the project
+    return {
+        "Title": HIT_TITLE,
+        "Description": HIT_DESCRIPTION,
+        "Keywords": HIT_KEYWORDS,
+        "Reward": reward,
+        "MaxAssignments": max_assignments,
+        "LifetimeInSeconds": HIT_LIFETIME_SECONDS,
+        "AssignmentDurationInSeconds": HIT_ASSIGNMENT_DURATION_SECONDS,
+        "Question": question_xml,
+        "QualificationRequirements": [
             {
                 "QualificationTypeId": qualification_type_id,
                 "Comparator": "Exists",
@@ -305,6 +469,15 @@ def create_hit_with_xml_file(xml_file_path, mturk_client, qualification_type_id)
                 "ActionsGuarded": "Accept",
             },
         ],
+    }
+
+
+def create_hit_with_xml_file(xml_file_path, mturk_client, qualification_type_id):
+    mturk_client = wrap_client(mturk_client)
+    with open(xml_file_path, "r") as file:
+        question_xml = file.read()
+    response = mturk_client.create_hit(
+        **hit_parameters(question_xml, qualification_type_id)
     )
     return response["HIT"]["HITId"]
 
@@ -319,29 +492,107 @@ def check_qualification(answers):
     return True
 
 
+def load_logged_requests(file_name):
+    # Reads the JSONL log, and the older log of indented JSON objects one after another
+    try:
+        with open(file_name, "r") as file:
+            content = file.read()
+    except FileNotFoundError:
+        return []
+    decoder = json.JSONDecoder()
+    requests, position = [], 0
+    while True:
+        while position < len(content) and content[position].isspace():
+            position += 1
+        if position >= len(content):
+            break
+        try:
+            request, position = decoder.raw_decode(content, position)
+        except ValueError:
+            # A line cut short by a crash ends the log
+            break
+        requests.append(request)
+    return requests
+
+
+def _decide_qualification_request(mturk_client, request, approve, file_name, lock):
+    request_id = request["QualificationRequestId"]
+    if approve:
+        mturk_client.accept_qualification_request(QualificationRequestId=request_id)
+        print(f"Approved and logged request: {request_id}")
+    else:
+        print(
+            f"Qualification request {request_id} did not meet the criteria. Rejecting..."
+        )
+        mturk_client.reject_qualification_request(
+            QualificationRequestId=request_id,
+            Reason="Your answers did not meet the criteria for this qualification.",
+        )
+    request_json = json.dumps(
+        dict(request, Decision="Accepted" if approve else "Rejected"), default=str
+    )
+    with lock:
+        with open(file_name, "a") as file:
+            file.write(request_json + "\n")
+
+
 def approve_qualifications(mturk_client, qualification_type_id, file_name):
+    # Every page of requests is listed first, then the requests that are not
+    # in the log yet are accepted or rejected concurrently and logged as JSONL
+    mturk_client = wrap_client(mturk_client)
+    summary = {"accepted": 0, "rejected": 0, "skipped": 0, "failed": 0}
     try:
-        qualification_requests = mturk_client.list_qualification_requests(
-            QualificationTypeId=qualification_type_id, MaxResults=100
+        qualification_requests = list(
+            mturk_client.paginate(
+                "list_qualification_requests",
+                "QualificationRequests",
+                QualificationTypeId=qualification_type_id,
+                MaxResults=100,
+            )
         )
-        for request in qualification_requests.get("QualificationRequests", []):
-            request_id = request["QualificationRequestId"]
-            if not check_qualification(parse_answer_xml(request["Answer"])[0]):
-                print(
-                    f"Qualification request {request_id} did not meet the criteria. Rejecting..."
-                )
-                mturk_client.reject_qualification_request(
-                    QualificationRequestId=request_id,
-                    Reason="Your answers did not meet the criteria for this qualification.",
-                )
-                continue
-            request_json = json.dumps(request, indent=4, default=str)
-            with open(file_name, "a") as file:
-                file.write(request_json + "\n")
-            mturk_client.accept_qualification_request(QualificationRequestId=request_id)
-            print(f"Approved and logged request: {request_id}")
     except Exception as e:
         print(f"An error occurred: {e}")
+        return summary
+
+    handled = {
+        request.get("QualificationRequestId")
+        for request in load_logged_requests(file_name)
+    }
+    pending = [
+        request
+        for request in qualification_requests
+        if request["QualificationRequestId"] not in handled
+    ]
+    summary["skipped"] = len(qualification_requests) - len(pending)
+    decisions = [
+        check_qualification(parse_answer_xml(request["Answer"])[0])
+        for request in pending
+    ]
+
+    lock = threading.Lock()
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=mturk_client.max_concurrency
+    ) as executor:
+        futures = {
+            executor.submit(
+                _decide_qualification_request,
+                mturk_client,
+                request,
+                approve,
+                file_name,
+                lock,
+            ): approve
+            for request, approve in zip(pending, decisions)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                print(f"An error occurred: {e}")
+                continue
+            summary["accepted" if futures[future] else "rejected"] += 1
+    return summary
 
 
 def serialize_datetime(obj):
@@ -360,6 +611,7 @@ def preprocess_hit(hit):
 
 
 def fetch_all_hits(mturk_client, cutoff_date, fetched_hits_file):
+    mturk_client = wrap_client(mturk_client)
     print("Fetching all HITs from MTurk...")
     all_hits = []
     next_token = None
@@ -378,14 +630,16 @@ def fetch_all_hits(mturk_client, cutoff_date, fetched_hits_file):
         next_token = response.get("NextToken")
         if not next_token:
             break
-    with open(fetched_hits_file, "w") as file:
-        json.dump(all_hits, file, default=serialize_datetime, indent=4)
+    save_json(all_hits, fetched_hits_file, indent=None)
     print("All HITs fetched and saved.")
 
 
-def save_json(data, file_path):
-    with open(file_path, "w") as file:
-        json.dump(data, file, default=serialize_datetime, indent=4)
+def save_json(data, file_path, indent=4):
+    # Write to a temporary file first so a crash never leaves a truncated file
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, default=serialize_datetime, indent=indent)
+    os.replace(tmp_path, file_path)
 
 
 def load_json(file_path):
@@ -404,6 +658,32 @@ def save_cache(cache, full_cache_path):
     save_json(cache, full_cache_path)
 
 
+def open_hit_cache(full_cache_path):
+    # A hit_data.json path maps to hit_data.sqlite, importing the JSON cache once
+    if not full_cache_path.endswith(".json"):
+        return HITCache(full_cache_path)
+    db_path = os.path.splitext(full_cache_path)[0] + ".sqlite"
+    needs_import = not os.path.exists(db_path) and os.path.exists(full_cache_path)
+    cache = HITCache(db_path)
+    if needs_import:
+        legacy_questions_path = os.path.splitext(full_cache_path)[0] + "_questions.json"
+        cache.import_json(load_cache(full_cache_path), load_json(legacy_questions_path))
+    return cache
+
+
+def list_all_assignments(mturk_client, hit_id, **kwargs):
+    mturk_client = wrap_client(mturk_client)
+    return list(
+        mturk_client.paginate(
+            "list_assignments_for_hit",
+            "Assignments",
+            HITId=hit_id,
+            MaxResults=100,
+            **kwargs,
+        )
+    )
+
+
 def convert_to_utc(dt_input):
     if isinstance(dt_input, str):
         dt = datetime.datetime.fromisoformat(dt_input)
@@ -419,19 +699,31 @@ def convert_to_utc(dt_input):
         return dt.replace(tzinfo=timezone.utc)
 
 
-def check_hit_and_fetch_assignments(mturk_client, hit, cache, current_time):
+def is_hit_finished(cache_hit, current_time):
+    cache_expiration = convert_to_utc(cache_hit["Expiration"])
+    return cache_expiration < current_time or (
+        cache_hit["NumberOfAssignmentsAvailable"] == 0
+        and cache_hit["NumberOfAssignmentsPending"] == 0
+    )
+
+
+def hit_signature(hit):
+    # Accepting, submitting, returning and reviewing all change one of these counts
+    return (
+        hit["NumberOfAssignmentsAvailable"],
+        hit["NumberOfAssignmentsPending"],
+        hit.get("NumberOfAssignmentsCompleted"),
+    )
+
+
+def store_hit_assignments(mturk_client, hit, cache):
     hit_id = hit["HITId"]
     expiration = convert_to_utc(hit["Expiration"])
-    current_time = current_time.astimezone(timezone.utc)
-    cache_hit = cache.get(hit_id)
-    if cache_hit:
-        cache_expiration = convert_to_utc(cache_hit["Expiration"])
-        if cache_expiration < current_time or (
-            cache_hit["NumberOfAssignmentsAvailable"] == 0
-            and cache_hit["NumberOfAssignmentsPending"] == 0
-        ):
-            return {"hit_id": hit_id, "data": cache_hit["Data"]}
-    assignments = mturk_client.list_assignments_for_hit(HITId=hit_id)["Assignments"]
+    question_xml = hit.get("Question")
+    if question_xml is None:
+        question_xml = mturk_client.get_hit(HITId=hit_id)["HIT"]["Question"]
+    hit_question_hash = question_hash(question_xml)
+    assignments = list_all_assignments(mturk_client, hit_id)
     assignment_data = [
         {
             "HITId": hit_id,
@@ -443,52 +735,401 @@ def check_hit_and_fetch_assignments(mturk_client, hit, cache, current_time):
             - convert_to_utc(assn["AcceptTime"]),
             "WorkerId": assn["WorkerId"],
             "Answer": assn["Answer"],
-            "Question": mturk_client.get_hit(HITId=hit_id)["HIT"]["Question"],
+            "QuestionHash": hit_question_hash,
         }
         for assn in assignments
     ]
-    cache[hit_id] = {
-        "Expiration": expiration.isoformat(),
-        "NumberOfAssignmentsAvailable": hit["NumberOfAssignmentsAvailable"],
-        "NumberOfAssignmentsPending": hit["NumberOfAssignmentsPending"],
-        "Data": assignment_data,
-    }
-    return {"hit_id": hit_id, "data": assignment_data}
+    cache.upsert_hit(
+        {
+            "HITId": hit_id,
+            "Expiration": expiration.isoformat(),
+            "NumberOfAssignmentsAvailable": hit["NumberOfAssignmentsAvailable"],
+            "NumberOfAssignmentsPending": hit["NumberOfAssignmentsPending"],
+            "QuestionHash": hit_question_hash,
+            "CreationTime": convert_to_utc(hit["CreationTime"]).isoformat()
+            if hit.get("CreationTime")
+            else None,
+            "NumberOfAssignmentsCompleted": hit.get("NumberOfAssignmentsCompleted"),
+        },
+        assignment_data,
+        question_xml,
+    )
+
+
+def check_hit_and_fetch_assignments(mturk_client, hit, cache, current_time):
+    hit_id = hit["HITId"]
+    current_time = current_time.astimezone(timezone.utc)
+    cache_hit = cache.get(hit_id)
+    if cache_hit and is_hit_finished(cache_hit, current_time):
+        return {"hit_id": hit_id, "cached": True}
+    store_hit_assignments(mturk_client, hit, cache)
+    return {"hit_id": hit_id, "cached": False}
 
 
 def count_non_expired_assignments_in_cache(full_cache_path):
-    cache = load_cache(full_cache_path)
+    cache = open_hit_cache(full_cache_path)
     current_time = datetime.datetime.now(timezone.utc)
     total_available = 0
     total_pending = 0
-    for hit_id, hit_data in cache.items():
+    for hit_data in cache.hits():
         expiration_time = datetime.datetime.fromisoformat(
             hit_data["Expiration"].replace("Z", "+00:00")
         )
         if expiration_time > current_time:
             total_available += hit_data.get("NumberOfAssignmentsAvailable", 0)
             total_pending += hit_data.get("NumberOfAssignmentsPending", 0)
+    cache.close()
     return total_available, total_pending
 
 
+def load_hit_results(cache, hit_ids=None, with_xml=True):
+    assignments = cache.get_assignments(hit_ids, with_answer=with_xml)
+    results_df = pd.DataFrame(assignments)
+    if with_xml and not results_df.empty:
+        # Every row refers to the same string object of its question form
+        questions = cache.questions(results_df["QuestionHash"].unique())
+        results_df["Question"] = results_df["QuestionHash"].map(questions)
+    return results_df
+
+
 def get_hit_results(mturk_client, fetched_hits_file, full_cache_path):
-    cache = load_cache(full_cache_path)
+    mturk_client = wrap_client(mturk_client)
+    cache = open_hit_cache(full_cache_path)
     hits = load_json(fetched_hits_file)
     current_time = datetime.datetime.now(timezone.utc)
-    all_results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=40) as executor:
-        future_to_hit = {
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=mturk_client.max_concurrency
+    ) as executor:
+        futures = [
             executor.submit(
                 check_hit_and_fetch_assignments, mturk_client, hit, cache, current_time
-            ): hit
+            )
             for hit in hits
-        }
-        for future in concurrent.futures.as_completed(future_to_hit):
-            result = future.result()
-            if result:
-                all_results.extend(result["data"])
-    save_cache(cache, full_cache_path)
-    return pd.DataFrame(all_results)
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    results_df = load_hit_results(cache, [hit["HITId"] for hit in hits])
+    cache.close()
+    return results_df
+
+
+def _refresh_hit(mturk_client, hit_id):
+    # None when MTurk no longer has the HIT, for example after it was deleted
+    try:
+        return preprocess_hit(mturk_client.get_hit(HITId=hit_id)["HIT"])
+    except ClientError as e:
+        print(f"Could not refresh HIT {hit_id}: {e}")
+        return None
+
+
+def sync_hit_results(mturk_client, full_cache_path, cutoff_date, full_sync=False):
+    # Only HITs and assignments that can still have changed are fetched.
+    # LastCreationTime marks the newest HIT seen. Listing stops at the first
+    # page whose HITs are all cached, created before the mark and finished.
+    # A page with an unknown HIT keeps the listing going, so HITs listed out
+    # of order are still found. Without a mark, after importing hit_data.json
+    # or with full_sync=True every page is listed.
+    mturk_client = wrap_client(mturk_client)
+    cache = open_hit_cache(full_cache_path)
+    current_time = datetime.datetime.now(timezone.utc)
+    last_creation_time = cache.get_meta("LastCreationTime")
+    known_hit_ids = set(cache.hit_ids())
+    open_hit_ids = set(cache.open_hit_ids(current_time.isoformat()))
+    # HITs imported from hit_data.json have no CreationTime yet
+    incomplete_hit_ids = set(cache.incomplete_hit_ids())
+    full_sync = full_sync or last_creation_time is None or bool(incomplete_hit_ids)
+
+    listed_hits = {}
+    newest_creation_time = last_creation_time
+    for response in mturk_client.pages("list_hits", MaxResults=100):
+        page_is_settled = bool(response["HITs"])
+        for hit in response["HITs"]:
+            hit = preprocess_hit(hit)
+            hit["CreationTime"] = convert_to_utc(hit["CreationTime"]).isoformat()
+            if newest_creation_time is None or hit["CreationTime"] > newest_creation_time:
+                newest_creation_time = hit["CreationTime"]
+            if full_sync or (
+                hit["HITId"] not in known_hit_ids
+                or hit["HITId"] in open_hit_ids
+                or hit["CreationTime"] > last_creation_time
+            ):
+                page_is_settled = False
+            if convert_to_utc(hit["CreationTime"]) > cutoff_date:
+                listed_hits[hit["HITId"]] = hit
+        if page_is_settled:
+            break
+
+    backfilled = [hit for hit_id, hit in listed_hits.items() if hit_id in incomplete_hit_ids]
+    if backfilled:
+        cache.backfill_hits(backfilled)
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=mturk_client.max_concurrency
+    ) as executor:
+        # Open HITs that were not listed are refreshed through the pool
+        unlisted_hit_ids = sorted(open_hit_ids - set(listed_hits))
+        gone_hit_ids = []
+        for hit_id, hit in zip(
+            unlisted_hit_ids,
+            executor.map(functools.partial(_refresh_hit, mturk_client), unlisted_hit_ids),
+        ):
+            if hit is None:
+                gone_hit_ids.append(hit_id)
+            else:
+                listed_hits[hit_id] = hit
+        if gone_hit_ids:
+            # They can take no more workers, so they are not refreshed again
+            cache.mark_finished(gone_hit_ids)
+
+        changed_hits = []
+        for hit_id, hit in listed_hits.items():
+            cache_hit = cache.get(hit_id)
+            if cache_hit is None or (
+                hit_id in open_hit_ids and hit_signature(cache_hit) != hit_signature(hit)
+            ):
+                changed_hits.append(hit)
+
+        futures = [
+            executor.submit(store_hit_assignments, mturk_client, hit, cache)
+            for hit in changed_hits
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    if newest_creation_time is not None:
+        cache.set_meta("LastCreationTime", newest_creation_time)
+    print(f"Synced {len(changed_hits)} changed HITs out of {len(listed_hits)} checked.")
+    results_df = load_hit_results(
+        cache, cache.hit_ids(created_after=convert_to_utc(cutoff_date).isoformat())
+    )
+    cache.close()
+    return results_df
+
+
+ASSIGNMENT_FIELDS = (
+    "WorkerId",
+    "HITId",
+    "AssignmentId",
+    "AssignmentStatus",
+    "AcceptTime",
+    "SubmitTime",
+    "Duration",
+)
+
+
+def format_duration(duration):
+    # The filters read durations written as "0 days 00:13:14"
+    if isinstance(duration, datetime.timedelta):
+        return str(pd.Timedelta(duration))
+    return duration
+
+
+def format_assignment(row, question_text, articles=None):
+    # Returns the JSON record and the readable text of one assignment,
+    # or None when it failed the control questions. articles maps the
+    # ArticleId of texts held by an ArticleStore to the stored text, those
+    # texts are written as a reference instead of in full.
+    answer_text, passed = parse_answer_xml(row["Answer"])
+    if passed < 0:
+        print(
+            f"Worker {row['WorkerId']} did not pass all questions for HIT {row['HITId']}"
+        )
+        return None
+
+    json_data = {field: row.get(field, "") for field in ASSIGNMENT_FIELDS}
+    json_data["Duration"] = format_duration(json_data["Duration"])
+    json_data["QuestionsAndAnswers"] = []
+
+    text_content = ""
+    for key, value in json_data.items():
+        if key != "QuestionsAndAnswers":
+            text_content += f"{key}: {value}\n"
+
+    for q in question_text:
+        q_index = q["Title"].split()[-1]
+        related_answers = [
+            a for a in answer_text if a["Question ID"].startswith(f"text{q_index}_")
+        ]
+        qa = {"Title": q["Title"], "QuestionText": q["Text"], "Answers": related_answers}
+        if articles is not None and q["Text"]:
+            qa["ArticleId"] = article_id(q["Text"])
+            if articles.get(qa["ArticleId"]) == q["Text"]:
+                qa["QuestionText"] = None
+        json_data["QuestionsAndAnswers"].append(qa)
+        text_content += f"\nTitle: {q['Title']}\nQuestion Text: {q['Text']}\n"
+        for a in related_answers:
+            text_content += f"- {a['Question ID']}: {a['Answer']}\n"
+
+    return json_data, text_content
+
+
+def _load_up_to_date(json_file_path, assignment_status):
+    # An existing file is reused until the status of its assignment changes
+    try:
+        with open(json_file_path, "r", encoding="utf-8") as json_file:
+            json_data = json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if json_data.get("AssignmentStatus") != assignment_status:
+        return None
+    return json_data
+
+
+def _parse_assignment_group(group, output_dir, write_files):
+    # All rows of a group share one question form, so it is parsed once
+    question_xml, rows, articles = group
+    question_text = parse_question_xml(question_xml)
+    results = []
+    for row in rows:
+        if write_files:
+            json_file_path = os.path.join(output_dir, f"{row['AssignmentId']}.json")
+            json_data = _load_up_to_date(
+                json_file_path, row.get("AssignmentStatus", "")
+            )
+            if json_data is not None:
+                results.append(("skipped", json_data))
+                continue
+
+        formatted = format_assignment(row, question_text, articles)
+        if formatted is None:
+            results.append(("failed", None))
+            continue
+        json_data, text_content = formatted
+
+        if write_files:
+            with open(json_file_path, "w", encoding="utf-8") as json_file:
+                json.dump(json_data, json_file, indent=4, default=str)
+            txt_file_path = os.path.join(output_dir, f"{row['AssignmentId']}.txt")
+            with open(txt_file_path, "w", encoding="utf-8") as txt_file:
+                txt_file.write(text_content)
+        results.append(("written", json_data))
+    return results
+
+
+def assignments_to_frame(records):
+    # One row per assignment, the per-text lists are stored as JSON strings
+    rows = []
+    for record in records:
+        row = {field: record.get(field, "") for field in ASSIGNMENT_FIELDS}
+        row["Duration"] = format_duration(row["Duration"])
+        qa_list = record["QuestionsAndAnswers"]
+        row["Titles"] = json.dumps([qa["Title"] for qa in qa_list], ensure_ascii=False)
+        row["QuestionText"] = json.dumps(
+            [qa["QuestionText"] for qa in qa_list], ensure_ascii=False
+        )
+        row["Answers"] = json.dumps(
+            [qa["Answers"] for qa in qa_list], ensure_ascii=False
+        )
+        if any("ArticleId" in qa for qa in qa_list):
+            row["ArticleIds"] = json.dumps([qa.get("ArticleId") for qa in qa_list])
+        rows.append(row)
+    columns = list(ASSIGNMENT_FIELDS) + ["Titles", "QuestionText", "Answers"]
+    if any("ArticleIds" in row for row in rows):
+        columns.append("ArticleIds")
+    frame = pd.DataFrame(rows, columns=columns)
+    return frame.fillna("").astype(str)
+
+
+def read_columnar(path, columns=None):
+    if path.endswith((".feather", ".arrow")):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_parquet(path, columns=columns)
+
+
+def write_columnar(frame, path):
+    # Written next to the final path first so readers never see a partial file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    if path.endswith(".arrow"):
+        # Uncompressed, so readers can memory-map the file
+        frame.reset_index(drop=True).to_feather(tmp_path, compression="uncompressed")
+    elif path.endswith(".feather"):
+        frame.reset_index(drop=True).to_feather(tmp_path)
+    else:
+        frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def parse_assignments(
+    results_df,
+    output_dir,
+    max_workers=None,
+    columnar_path=None,
+    write_files=True,
+    article_store=None,
+):
+    # Writes a JSON and a TXT file per assignment to output_dir. Assignments
+    # whose output exists with the same AssignmentStatus are not parsed again.
+    # With columnar_path all assignments are also written to one Parquet
+    # (.parquet) or Arrow (.feather, .arrow) file, write_files=False writes
+    # only that file. With an article_store the article texts are stored
+    # there once and the JSON records refer to them by ArticleId.
+    if write_files:
+        os.makedirs(output_dir, exist_ok=True)
+    rows = results_df.to_dict("records")
+
+    columnar_rows = []
+    if not write_files and columnar_path and os.path.exists(columnar_path):
+        existing = read_columnar(columnar_path)
+        current = {row["AssignmentId"]: row.get("AssignmentStatus", "") for row in rows}
+        up_to_date = (
+            existing["AssignmentId"].map(current) == existing["AssignmentStatus"]
+        )
+        columnar_rows.append(existing[up_to_date])
+        done = set(existing.loc[up_to_date, "AssignmentId"])
+        rows = [row for row in rows if row["AssignmentId"] not in done]
+    skipped = sum(len(frame) for frame in columnar_rows)
+
+    # Rows are grouped by question form and every group is handled by one worker
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["Question"], []).append(row)
+    grouped = []
+    for question_xml, group_rows in groups.items():
+        articles = None
+        if article_store is not None:
+            # Articles are stored before any record refers to them
+            texts = [text.strip() for text in overview_texts(question_xml)]
+            articles = article_store.get_many(article_store.put_many(texts))
+        grouped.append((question_xml, group_rows, articles))
+    groups = grouped
+
+    parse_group = functools.partial(
+        _parse_assignment_group, output_dir=output_dir, write_files=write_files
+    )
+    if max_workers == 1 or len(groups) < 2:
+        group_results = map(parse_group, groups)
+        executor = None
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        group_results = executor.map(
+            parse_group, groups, chunksize=max(1, len(groups) // (max_workers * 4))
+        )
+
+    counts = {"written": 0, "skipped": skipped, "failed": 0}
+    records = []
+    try:
+        for results in group_results:
+            for status, json_data in results:
+                counts[status] += 1
+                if json_data is not None:
+                    records.append(json_data)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if columnar_path:
+        columnar_rows.append(assignments_to_frame(records))
+        write_columnar(pd.concat(columnar_rows, ignore_index=True), columnar_path)
+
+    print(
+        f"Parsed {counts['written']} assignments, {counts['skipped']} up to date, "
+        f"{counts['failed']} failed the control questions."
+    )
+    return counts
 
 
 def extract_questions_from_xml(xml_file):
@@ -497,15 +1138,17 @@ def extract_questions_from_xml(xml_file):
     return extract_texts_from_xml(question_xml)
 
 
-def extract_texts_from_xml(xml_q):
-    parsed_question = parse_question_xml(xml_q)
+def extract_texts_from_xml(xml_q, question_key=None):
     questions_123 = [
-        question["Text"] for question in parsed_question if "Tekst" in question["Title"]
+        text
+        for title, text in parse_question_form(xml_q, question_key)
+        if "Tekst" in title
     ]
     return questions_123
 
 
 def expire_all_active_hits(mturk_client):
+    mturk_client = wrap_client(mturk_client)
     utc_now = datetime.datetime.now(pytz.UTC)
     utc_yesterday = utc_now - timedelta(days=1)
     next_token = None
@@ -524,11 +1167,17 @@ def expire_all_active_hits(mturk_client):
             break
 
 
+REJECT_FEEDBACK = "Your work did not meet the required standards, as you had too few correct multiple choice answers or wrong sourcing. We encourage you to try again!"
+APPROVE_FEEDBACK = "Good work, thank you!"
+BLOCK_REASON = "Repeatedly submitting low-quality work"
+
+
 def reject_hit(mturk_client, assignment_id, hit_organizer):
+    mturk_client = wrap_client(mturk_client)
     try:
         mturk_client.reject_assignment(
             AssignmentId=assignment_id,
-            RequesterFeedback="Your work did not meet the required standards, as you had too few correct multiple choice answers or wrong sourcing. We encourage you to try again!",
+            RequesterFeedback=REJECT_FEEDBACK,
         )
         hit_organizer.organize_file(assignment_id, approve=False)
         print(f"Rejected HIT: {assignment_id}")
@@ -537,10 +1186,11 @@ def reject_hit(mturk_client, assignment_id, hit_organizer):
 
 
 def approve_hit(mturk_client, assignment_id, hit_organizer):
+    mturk_client = wrap_client(mturk_client)
     try:
         mturk_client.approve_assignment(
             AssignmentId=assignment_id,
-            RequesterFeedback="Good work, thank you!",
+            RequesterFeedback=APPROVE_FEEDBACK,
             OverrideRejection=False,
         )
         hit_organizer.organize_file(assignment_id, approve=True)
@@ -550,118 +1200,134 @@ def approve_hit(mturk_client, assignment_id, hit_organizer):
 
 
 def ban_worker(mturk_client, worker_id):
+    mturk_client = wrap_client(mturk_client)
     try:
         mturk_client.create_worker_block(
             WorkerId=worker_id,
-            Reason="Repeatedly submitting low-quality work",
+            Reason=BLOCK_REASON,
         )
         print(f"Blocked Worker: {worker_id}")
     except mturk_client.exceptions.RequestError as e:
         print(f"Error: {e}")
 
 
-def retrieve_and_count_questions(mturk_client, rejected_assignment_ids):
-    questions_data = {}
-    next_token = None
-    while True:
-        response = (
-            mturk_client.list_hits(NextToken=next_token)
-            if next_token
-            else mturk_client.list_hits()
-        )
-        for hit in response["HITs"]:
-            hit_id = hit["HITId"]
-            question = hit["Question"]
-            is_expired = hit["Expiration"] < datetime.datetime.now(timezone.utc)
-            parsed_question = tuple(extract_texts_from_xml(question))
-            if parsed_question not in questions_data:
-                questions_data[parsed_question] = {
-                    "total_count": 0,
-                    "hit_ids": set(),
-                    "question_xml": hit["Question"],
-                }
-            assignments_response = mturk_client.list_assignments_for_hit(HITId=hit_id)
-            for assignment in assignments_response["Assignments"]:
-                if (
-                    assignment["AssignmentStatus"]
-                    in ["Submitted", "Approved", "Pending"]
-                    and assignment["AssignmentId"] not in rejected_assignment_ids
-                ):
-                    questions_data[parsed_question]["total_count"] += 1
-            questions_data[parsed_question]["total_count"] += hit[
-                "NumberOfAssignmentsPending"
-            ]
-            if not is_expired:
-                questions_data[parsed_question]["total_count"] += hit[
-                    "NumberOfAssignmentsAvailable"
-                ]
-            questions_data[parsed_question]["hit_ids"].add(hit_id)
-        next_token = response.get("NextToken")
-        if not next_token:
-            break
-    return questions_data
+def index_hit_xml_files(directories):
+    # Maps the texts of every generated HIT XML file to its path
+    xml_index = {}
+    for directory in directories:
+        with os.scandir(directory) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.name.endswith(".xml"):
+                    question = tuple(extract_questions_from_xml(entry.path))
+                    xml_index[question] = directory + "/" + entry.name
+    return xml_index
 
 
-def retrieve_and_count_questions_from_cache(
-    mturk_client, rejected_assignment_ids, fetched_hits_file
+def _count_hit_assignments(mturk_client, hit, rejected_assignment_ids, statuses):
+    # Returns the parsed question of a HIT and the assignments that cover it
+    parsed_question = tuple(extract_texts_from_xml(hit["Question"]))
+    is_expired = convert_to_utc(hit["Expiration"]) < datetime.datetime.now(
+        timezone.utc
+    )
+    count = sum(
+        1
+        for assignment in list_all_assignments(mturk_client, hit["HITId"])
+        if assignment["AssignmentStatus"] in statuses
+        and assignment["AssignmentId"] not in rejected_assignment_ids
+    )
+    count += hit["NumberOfAssignmentsPending"]
+    if not is_expired:
+        count += hit["NumberOfAssignmentsAvailable"]
+    return parsed_question, count
+
+
+def _add_coverage(questions_data, hit, parsed_question, count):
+    if parsed_question not in questions_data:
+        questions_data[parsed_question] = {
+            "total_count": 0,
+            "hit_ids": set(),
+            "question_xml": hit["Question"],
+        }
+    questions_data[parsed_question]["total_count"] += count
+    questions_data[parsed_question]["hit_ids"].add(hit["HITId"])
+
+
+def count_question_coverage(
+    mturk_client,
+    rejected_assignment_ids,
+    hits=None,
+    xml_index=None,
+    statuses=("Submitted", "Approved", "Pending"),
 ):
+    # Counts the assignments that cover every distinct question form.
+    # HITs are streamed from list_hits (or the given hits) into a thread pool
+    # with a bounded number in flight, and the assignments of each HIT are
+    # paginated. With xml_index (see index_hit_xml_files) every question also
+    # gets the path of its HIT XML file.
+    mturk_client = wrap_client(mturk_client)
+    rejected_assignment_ids = set(rejected_assignment_ids)
+    statuses = set(statuses)
+    if hits is None:
+        hits = mturk_client.paginate("list_hits", "HITs", MaxResults=100)
+
     questions_data = {}
-    all_hits = load_json(fetched_hits_file)
-    lock = threading.Lock()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-        futures = [
-            executor.submit(
-                process_hit_and_count_questions,
-                hit,
-                mturk_client,
-                questions_data,
-                lock,
-                rejected_assignment_ids,
+    max_workers = mturk_client.max_concurrency
+    in_flight = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for hit in hits:
+            in_flight.append(
+                (
+                    hit,
+                    executor.submit(
+                        _count_hit_assignments,
+                        mturk_client,
+                        hit,
+                        rejected_assignment_ids,
+                        statuses,
+                    ),
+                )
             )
-            for hit in all_hits
-        ]
-        concurrent.futures.wait(futures)
+            if len(in_flight) >= max_workers * 4:
+                hit, future = in_flight.popleft()
+                _add_coverage(questions_data, hit, *future.result())
+        for hit, future in in_flight:
+            _add_coverage(questions_data, hit, *future.result())
+
+    if xml_index is not None:
+        for parsed_question, data in questions_data.items():
+            xml_file = xml_index.get(parsed_question)
+            if xml_file is not None:
+                data["xml_file"] = xml_file
+            else:
+                print(f"XML data not found for question tuple: {parsed_question}")
     return questions_data
 
 
-def process_hit_and_count_questions(
-    hit, mturk_client, questions_data, lock, rejected_assignment_ids
+def retrieve_and_count_questions(
+    mturk_client, rejected_assignment_ids, xml_index=None
 ):
-    hit_id = hit["HITId"]
-    question = hit["Question"]
-    expiration = datetime.datetime.fromisoformat(hit["Expiration"]).replace(
-        tzinfo=timezone.utc
+    return count_question_coverage(
+        mturk_client, rejected_assignment_ids, xml_index=xml_index
+    )
+
+
+def retrieve_and_count_questions_from_cache(
+    mturk_client, rejected_assignment_ids, fetched_hits_file, xml_index=None
+):
+    # The fetched HITs are read from disk, only their assignments are listed
+    return count_question_coverage(
+        mturk_client,
+        rejected_assignment_ids,
+        hits=load_json(fetched_hits_file),
+        xml_index=xml_index,
+        statuses=("Submitted", "Approved"),
     )
-    is_expired = expiration < datetime.datetime.now(timezone.utc)
-    parsed_question = tuple(extract_texts_from_xml(question))
-    assignments_response = mturk_client.list_assignments_for_hit(HITId=hit_id)
-    count = 0
-    for assignment in assignments_response["Assignments"]:
-        if (
-            assignment["AssignmentStatus"] in ["Submitted", "Approved"]
-            and assignment["AssignmentId"] not in rejected_assignment_ids
-        ):
-            count += 1
-    with lock:
-        if parsed_question not in questions_data:
-            questions_data[parsed_question] = {
-                "total_count": 0,
-                "hit_ids": set(),
-                "question_xml": question,
-            }
-        questions_data[parsed_question]["total_count"] += (
-            count + hit["NumberOfAssignmentsPending"]
-        )
-        if not is_expired:
-            questions_data[parsed_question]["total_count"] += hit[
-                "NumberOfAssignmentsAvailable"
-            ]
-        questions_data[parsed_question]["hit_ids"].add(hit_id)
 
 
 def create_consolidated_additional_hits(
     mturk_client, questions_data, qualification_type_id
 ):
+    mturk_client = wrap_client(mturk_client)
     counter = 0
     ass_counter = 0
     for question, data in questions_data.items():
@@ -676,27 +1342,11 @@ def create_consolidated_additional_hits(
             counter += 1
             ass_counter += additional_assignments
             new_hit_id = mturk_client.create_hit(
-                Title="NorwAI Norwegian/Norsk Annotation",
-                Description="Les en nyhetsartikkel og gi et sammendrag og svar på spørsmål.",
-                Keywords="nyheter, annotering, sammendrag, lesing",
-                Reward="6.00",
-                MaxAssignments=additional_assignments,
-                LifetimeInSeconds=1920000,
-                AssignmentDurationInSeconds=1800,
-                Question=question_xml,
-                QualificationRequirements=[
-                    {
-                        "QualificationTypeId": qualification_type_id,
-                        "Comparator": "Exists",
-                        "ActionsGuarded": "Accept",
-                    },
-                    {
-                        "QualificationTypeId": "000000000000000000L0",
-                        "Comparator": "GreaterThan",
-                        "IntegerValues": [60],
-                        "ActionsGuarded": "Accept",
-                    },
-                ],
+                **hit_parameters(
+                    question_xml,
+                    qualification_type_id,
+                    max_assignments=additional_assignments,
+                )
             )["HIT"]["HITId"]
             print(
                 f"Created new HIT with ID: {new_hit_id} for question '{data['xml_file']}' with {additional_assignments} additional assignments."
@@ -0,0 +1,63 @@
+import re
+import unicodedata
+
+# Compiled once at import, shared by the dataset conversion and the HIT generation
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002702-\U000027B0"
+    "\U000024C2-\U0001F251"
+    "]+",
+    flags=re.UNICODE,
+)
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def remove_emojis(text):
+    return EMOJI_PATTERN.sub("", text)
+
+
+def remove_emojis_batch(texts):
+    # Accepts a pandas Series (cleaned in one vectorized call) or any iterable of strings
+    if hasattr(texts, "str"):
+        return texts.str.replace(EMOJI_PATTERN, "", regex=True)
+    sub = EMOJI_PATTERN.sub
+    return [sub("", text) for text in texts]
+
+
+def normalize_whitespace(text):
+    return WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text))
+
+
+def normalize_text(text):
+    return normalize_whitespace(text).strip()
+
+
+# Usage
+
+if __name__ == "__main__":
+    import sys
+    import timeit
+    import pandas as pd
+
+    csv_data = sys.argv[1] if len(sys.argv) > 1 else "dataset/Topic_centric_PersonalSum.csv"
+    articles = pd.read_csv(csv_data)["Article"].dropna()
+    total_chars = articles.str.len().sum()
+
+    def recompile_per_call(text):
+        return re.compile(EMOJI_PATTERN.pattern, flags=re.UNICODE).sub("", text)
+
+    benchmarks = {
+        "compile per call": lambda: [recompile_per_call(text) for text in articles],
+        "precompiled": lambda: [remove_emojis(text) for text in articles],
+        "batch list": lambda: remove_emojis_batch(articles.tolist()),
+        "batch Series": lambda: remove_emojis_batch(articles),
+    }
+    print(f"{len(articles)} articles, {total_chars / 1e6:.1f}M characters")
+    for name, benchmark in benchmarks.items():
+        seconds = min(timeit.repeat(benchmark, number=1, repeat=5))
+        print(f"{name:>16}: {seconds * 1000:8.2f} ms  {total_chars / seconds / 1e6:8.1f}M chars/s")